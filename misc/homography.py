@@ -5,25 +5,25 @@ import numpy as np
 
 
 def transform_point(p, h):
-    """ Transforms a 2D point according to a homography matrix.
+    """ Transforms 2D points according to a homography matrix.
 
-    Similar to OpenCV's warpPerspective function, but operates on a single point.
+    Similar to OpenCV's warpPerspective function, but operates on points.
 
     Parameters
     ----------
     p : ndarray
-        A 2D point.
+        A 2xN array of 2D points, one per column.
     h : ndarray
         A homography matrix.
 
     Returns
     -------
     pt : ndarray
-        The point after transformation.
+        The 2xN points after transformation.
 
     """
-    p = np.vstack((p, 1))  # (x, y, 1)^T
-    d = np.dot(h, p)       # h * p
+    p = np.vstack((p, np.ones((1, p.shape[1]))))  # (x, y, 1)^T per column
+    d = np.dot(h, p)                              # h * p
     return (d / d[2])[0:2] # Divide rows 1 and 2 by 3, return only these rows
 
 if __name__ == '__main__':
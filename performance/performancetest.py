@@ -7,6 +7,8 @@ import cv2
 from cv2 import xfeatures2d
 import numpy as np
 
+from .tests.utils import overlap_error, points_in_mask, transform_points
+
 class PerformanceTest(metaclass=ABCMeta):
     """
     Accepted kwargs
@@ -29,19 +31,7 @@ class PerformanceTest(metaclass=ABCMeta):
 
     @staticmethod
     def get_overlap_error(kp1, kp2, h, shape):
-        img1 = np.zeros(shape, np.uint8)
-        cv2.circle(img1, (round(kp1.pt[0]), round(kp1.pt[1])), round(kp1.size / 2), 255, -1, cv2.LINE_AA)
-
-        img2 = np.zeros(shape, np.uint8)
-        cv2.circle(img2, (round(kp2.pt[0]), round(kp2.pt[1])), round(kp2.size / 2), 255, -1, cv2.LINE_AA)
-        img2 = cv2.warpPerspective(img2, h, shape[1::-1])
-
-        union = np.sum(cv2.bitwise_or(img1, img2))
-        intersection = np.sum(cv2.bitwise_and(img1, img2))
-        if union == 0:
-            return 1
-        else:
-            return 1 - (intersection / union)
+        return overlap_error([kp1.pt], [kp1.size], [kp2.pt], [kp2.size], h, shape, method='raster')[0]
 
     @staticmethod
     def transform_point(kp, h):
@@ -60,10 +50,7 @@ class PerformanceTest(metaclass=ABCMeta):
         output: array-like
             The new keypoint's location.
         """
-        p = np.array(kp + (1,)).reshape(3, 1) # Converts to homogenous coords
-        d = np.dot(h, p)                      # h * p
-        d = (d / d[2])[0:2]                   # Converts from homogenous coords
-        return (d[0, 0], d[1, 0])             # Converts back to a tuple
+        return tuple(transform_points([kp], h)[0])
 
     @staticmethod
     def point_in_image(kp, mask):
@@ -76,18 +63,7 @@ class PerformanceTest(metaclass=ABCMeta):
         mask: array_like
             A mask created with create_mask().
         """
-        kp = np.rint(kp).astype(int)
-        x, y = kp[0], kp[1]
-
-        if x < 0 or y < 0:
-            return False
-
-        try:
-            ret = mask.item(y, x) != 0 # If mask rectangle is visible
-        except IndexError:
-            return False # Outside the mask rectangle image boundaries
-
-        return ret
+        return bool(points_in_mask([kp], mask)[0])
 
     @staticmethod
     def create_mask(shape, h):
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
+"""
+Plot the precision and recall of matching an image against img1 of its
+sequence.
+
+Usage: python -m performance.precisionrecall image
+run from the top of the repository.
+"""
 
 from collections import OrderedDict
 import csv
-from os.path import isfile, join
+from itertools import zip_longest
+from os.path import abspath, isfile, join
 import re
 import sys
 
@@ -11,13 +19,31 @@ from matplotlib import pyplot as plt
 from matplotlib.ticker import FuncFormatter
 import numpy as np
 
-from performancetest import PerformanceTest
+from .performancetest import PerformanceTest
+from .tests.geometry import sequence_geometry
+from .tests.imagestore import ImageStore
+from .tests.keypoints import from_cv, points
+from .tests.matchers import Matcher
+from .tests.utils import overlap_error, precision_recall_curve, transform_points
 
 
 class PrecisionRecall(PerformanceTest):
+    """
+    Accepted kwargs
+
+    testimg: the image to match against img1 of the same directory
+    overlap: 'analytic' (default) or 'raster', see tests.utils.overlap_error
+    cache: a tests.cache.FeatureCache to reuse keypoints and descriptors from
+    store: a tests.imagestore.ImageStore to read the images from
+    matcher: a tests.matchers.Matcher to match the descriptors with, brute force by default
+    """
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        self.overlap = kwargs.get('overlap', 'analytic')
+        self.cache = kwargs.get('cache')
+        self.matcher = kwargs.get('matcher') or Matcher('bf')
+
         testname = kwargs['testimg']
         m = re.match('(\w+)/img(\d).(\w+)', testname)
         (dir, num, ext) = m.groups()
@@ -25,18 +51,31 @@ class PrecisionRecall(PerformanceTest):
 
         self.det = cv2.xfeatures2d.SURF_create()
 
-        self.img1 = cv2.imread(basename, cv2.IMREAD_GRAYSCALE)
-        self.img2 = cv2.imread(testname, cv2.IMREAD_GRAYSCALE)
+        store = kwargs.get('store') or ImageStore()
+        self.img1 = store.image(basename)
+        self.img2 = store.image(testname)
 
-        self.h = np.loadtxt(join(dir, 'H1to' + num + 'p'))
-        self.hi = np.linalg.inv(self.h)
+        self.num = int(num)
+        self.geometry = sequence_geometry(abspath(dir), self.img1.shape[:2])
+        self.h = self.geometry.h[self.num]
+        self.hi = self.geometry.hi[self.num]
 
-        self.kp1 = self.det.detect(self.img1, None)
-        self.kp2 = self.det.detect(self.img2, None)
+        self.kp1 = self._detect(self.img1)
+        self.kp2 = self._detect(self.img2)
 
         self.precision = OrderedDict()
         self.recall = OrderedDict()
 
+    def _detect(self, image):
+        if self.cache is not None:
+            return self.cache.detect(self.det, image)
+        return self.det.detect(image, None)
+
+    def _compute(self, des, image, keypoints):
+        if self.cache is not None:
+            return self.cache.compute(des, image, keypoints)
+        return des.compute(image, keypoints)
+
     def run_test(self, desc):
         des = self.create_descriptor(desc, 'SURF')
         if des is None:
@@ -44,56 +83,32 @@ class PrecisionRecall(PerformanceTest):
 
         print("Testing {}".format(desc))
 
-        kp1, des1 = des.compute(self.img1, self.kp1)
-        kp2, des2 = des.compute(self.img2, self.kp2)
-        mask = self.create_mask(self.img1.shape, self.hi)
-
-        if des1.dtype == np.float32:
-            bf = cv2.BFMatcher(cv2.NORM_L2)
-        else:
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING)
-        matches = bf.match(des1, des2)
-
-        corresponding = []
-        for i, m in enumerate(matches):
-            if i % 100 == 0:
-                print("Processing match {:4} of {:4}, corresponding={:4}".format(i, len(matches), len(corresponding)))
-
-            query = kp1[m.queryIdx]
-            train = kp2[m.trainIdx]
-            transformed = self.transform_point(train.pt, self.hi)
-
-            # Remove points outside the common image area
-            if self.point_in_image(query.pt, mask) is False:
-                matches.remove(m)
-                continue
-            if self.point_in_image(transformed, mask) is False:
-                matches.remove(m)
-                continue
-
-            if self.get_overlap_error(query, train, self.hi, self.img1.shape) < 0.4:
-                corresponding.append(m)
-
-        if len(corresponding) == 0:
-            return
+        kp1, des1 = self._compute(des, self.img1, self.kp1)
+        kp2, des2 = self._compute(des, self.img2, self.kp2)
 
-        precision = []
-        recall = []
-        dists = [m.distance for m in matches]
-        for t in np.linspace(np.min(dists), np.max(dists)):
-            tp = fp = 0
+        matches = self.matcher.match(des1, des2)
 
-            for m in [mat for mat in matches if mat.distance < t]:
-                if m in corresponding:
-                    tp += 1
-                else:
-                    fp += 1
+        qidx = np.array([m.queryIdx for m in matches], int)
+        tidx = np.array([m.trainIdx for m in matches], int)
+        dists = np.array([m.distance for m in matches])
 
-            if (tp + fp) == 0:
-                continue
+        kp1 = from_cv(kp1, ('size',))[qidx]
+        kp2 = from_cv(kp2, ('size',))[tidx]
+        pts1, sizes1 = points(kp1), kp1['size']
+        pts2, sizes2 = points(kp2), kp2['size']
+
+        # Remove points outside the common image area
+        common = self.geometry.common(pts1, self.num)
+        common &= self.geometry.common(transform_points(pts2, self.hi), self.num)
+
+        errors = overlap_error(pts1[common], sizes1[common], pts2[common], sizes2[common],
+                               self.hi, self.img1.shape, self.overlap)
+        correct = errors < 0.4
+
+        if not np.any(correct):
+            return
 
-            precision.append(fp / len(matches))
-            recall.append(tp / len(corresponding))
+        precision, recall = precision_recall_curve(dists[common], correct)[1:]
 
         self.precision[desc] = precision
         self.recall[desc] = recall
@@ -109,7 +124,7 @@ class PrecisionRecall(PerformanceTest):
 
     def show_plots(self):
         for key in self.precision.keys():
-            plt.plot(self.precision[key], self.recall[key], '+', label=key)
+            plt.plot(self.precision[key], self.recall[key], label=key)
 
         plt.xlabel("1-precision")
         plt.xlim((0, 1))
@@ -124,12 +139,12 @@ class PrecisionRecall(PerformanceTest):
         with open(join('results', 'precision.csv'), 'w') as f:
             writer = csv.writer(f)
             writer.writerow(list(self.precision.keys()))
-            writer.writerows(zip(*self.precision.values()))
+            writer.writerows(zip_longest(*self.precision.values(), fillvalue=''))
 
         with open(join('results', 'recall.csv'), 'w') as f:
             writer = csv.writer(f)
             writer.writerow(list(self.recall.keys()))
-            writer.writerows(zip(*self.recall.values()))
+            writer.writerows(zip_longest(*self.recall.values(), fillvalue=''))
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+import itertools
+from os.path import join
+from time import perf_counter
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from ..utils import get_cpu_name
+from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .utils import ensure_path
+
+
+def time_call(func, *args, repeat=5):
+    """
+    Time repeated calls of a function.
+
+    Returns
+    -------
+    result
+        The return value of the last call.
+    np.ndarray
+        The time taken by each call, in ms.
+    """
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = perf_counter()
+        result = func(*args)
+        times[i] = (perf_counter() - start) * 1000  # s -> ms
+    return result, times
+
+
+def summarise(times):
+    """Median, 95th percentile and median absolute deviation of some times."""
+    median = np.median(times)
+    return median, np.percentile(times, 95), np.median(np.abs(times - median))
+
+
+def opencv_state():
+    """Record the settings which change OpenCV's speed."""
+    return {
+        'threads': cv2.getNumThreads(),
+        'optimized': cv2.useOptimized(),
+        'opencl': cv2.ocl.useOpenCL(),
+        'cpu': get_cpu_name(),
+    }
+
+
+@contextmanager
+def opencv_settings(threads=None, optimized=None, opencl=None):
+    """
+    Change the settings which change OpenCV's speed, for a with block.
+
+    Settings left as None are not changed, and all of them are restored
+    afterwards.
+    """
+    old = (cv2.getNumThreads(), cv2.useOptimized(), cv2.ocl.useOpenCL())
+    try:
+        if threads is not None:
+            cv2.setNumThreads(threads)
+        if optimized is not None:
+            cv2.setUseOptimized(optimized)
+        if opencl is not None:
+            cv2.ocl.setUseOpenCL(opencl)
+        yield
+    finally:
+        cv2.setNumThreads(old[0])
+        cv2.setUseOptimized(old[1])
+        cv2.ocl.setUseOpenCL(old[2])
+
+
+def run_test(files, full=False, warmup=1, repeat=5, threads=1, store=None):
+    """
+    Run the micro-benchmark of detection and description
+
+    Images are read through an ImageStore, by default a new one. Each
+    combination is warmed up on the first image, then detection and
+    description are timed separately, repeat times per image. OpenCV is
+    limited to the given number of threads while the benchmark runs.
+    """
+    columns = ['detector', 'descriptor', 'stage', 'median', 'p95', 'mad', 'samples', 'nkp']
+
+    if store is None:
+        store = ImageStore()
+    images = store.images(files)
+
+    det_s = DetectorDescriptor.detector_names(full)
+    des_s = DetectorDescriptor.descriptor_names(full)
+
+    with opencv_settings(threads):
+        state = opencv_state()
+        data = []
+
+        for detector, descriptor in itertools.product(det_s, des_s):
+            algo = DetectorDescriptor(detector, descriptor)
+            if algo.desc is None:
+                continue
+
+            print(f"Benchmarking {detector} + {descriptor}")
+            for _ in range(warmup):
+                algo.compute(images[0], algo.detect(images[0]))
+
+            det_times = []
+            des_times = []
+            nkp = 0
+            for image in images:
+                keypoints, times = time_call(algo.detect, image, repeat=repeat)
+                det_times.append(times)
+
+                (keypoints, _), times = time_call(algo.compute, image, keypoints, repeat=repeat)
+                des_times.append(times)
+                nkp += len(keypoints)
+
+            for stage, times in (('detect', det_times), ('compute', des_times)):
+                times = np.concatenate(times)
+                data.append([detector, descriptor, stage, *summarise(times), len(times), nkp])
+
+    df = pd.DataFrame(data, columns=columns)
+    for key, value in state.items():
+        df[key] = value
+
+    path = join('results', 'benchmark.csv')
+    ensure_path(path)
+    df.to_csv(path)
+    return df
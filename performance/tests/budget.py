@@ -0,0 +1,113 @@
+import itertools
+import os
+
+import matplotlib.pyplot as plt
+from matplotlib import ticker
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .benchmark import time_call
+from .detectordescriptor import DetectorDescriptor
+from .geometry import image_number, sequence_geometry
+from .imagestore import ImageStore
+from .keypoints import points
+from .repeatability import count_repeated
+from .results import ResultsWriter
+from .utils import ensure_path, retain_best, transform_points
+
+
+def run_test(files, budgets=(100, 500, 1000, 5000), full=False, threshold=2, repeat=3, store=None,
+             resume=False):
+    """
+    Run the keypoint budget test
+
+    The keypoints of each detector are capped to the strongest budget of
+    them before description, as a tracker sizing its per-frame work would,
+    so that algorithms are compared on the same number of keypoints. For
+    each budget, the median time of describing them and the repeatability of
+    the described keypoints are measured.
+
+    Rows are written to results/budget.csv as they finish. With resume, the
+    images already in that file are skipped.
+    """
+    columns = ['detector', 'descriptor', 'budget', 'sequence', 'image', 'compute', 'nkp', 'common',
+               'repeat']
+
+    if store is None:
+        store = ImageStore()
+
+    results = ResultsWriter(os.path.join('results', 'budget.csv'), columns,
+                            ['detector', 'descriptor', 'budget', 'sequence', 'image'], resume=resume)
+    with results:
+        for detector, descriptor in itertools.product(DetectorDescriptor.detector_names(full),
+                                                      DetectorDescriptor.descriptor_names(full)):
+            algo = DetectorDescriptor(detector, descriptor)
+            if algo.desc is None:
+                continue
+            print("Running test {} + {}".format(detector, descriptor))
+
+            for f in files:
+                sequence = os.path.basename(os.path.dirname(os.path.abspath(f)))
+                filename = os.path.basename(f).split('.')[0]
+                n = image_number(f)
+
+                # The base image is always needed by the rest of its sequence
+                if n != 1 and all(results.done(detector, descriptor, b, sequence, filename)
+                                  for b in budgets):
+                    continue
+
+                image = store.image(f)
+                if n == 1:
+                    geometry = sequence_geometry(os.path.abspath(os.path.dirname(f)), image.shape[:2])
+                    base = {}
+                keypoints = algo.detect(image)
+
+                for budget in budgets:
+                    kps = [keypoints[i] for i in retain_best(keypoints, budget)]
+                    (kps, _), times = time_call(algo.compute, image, kps, repeat=repeat)
+                    pts = points(kps)
+
+                    if n == 1:
+                        base[budget] = pts, cKDTree(pts)
+                        common = repeated = len(pts)
+                    else:
+                        basepts, basetree = base[budget]
+                        valid = geometry.common(basepts, n)
+                        tps = transform_points(pts, geometry.hi[n])
+                        tps = tps[geometry.common(tps, n)]
+                        common = np.count_nonzero(valid)
+                        repeated = count_repeated(basetree, valid, tps, threshold)
+
+                    if not results.done(detector, descriptor, budget, sequence, filename):
+                        results.append([detector, descriptor, budget, sequence, filename,
+                                        np.median(times), len(pts), common, repeated])
+
+    df = results.read()
+    df['repeatability'] = df['repeat'] / df['common']
+    return df
+
+
+def generate_plots(df):
+    """Plot the compute time and repeatability against the budget for each detector."""
+    data = df.groupby(['detector', 'descriptor', 'budget'])[['compute', 'nkp', 'repeatability']].mean()
+
+    for detector, det_data in data.groupby(level='detector'):
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 4), sharex=True)
+
+        for (_, descriptor), line in det_data.groupby(level=['detector', 'descriptor']):
+            budget = line.index.get_level_values('budget')
+            ax1.plot(budget, line['compute'], marker='o', label=descriptor)
+            ax2.plot(budget, line['repeatability'], marker='o', label=descriptor)
+
+        ax1.set(xscale='log', yscale='log', xlabel="Keypoint budget", ylabel="Compute time / ms")
+        ax2.set(xscale='log', xlabel="Keypoint budget", ylabel="Repeatability")
+        ax2.yaxis.set_major_formatter(ticker.PercentFormatter(xmax=1))
+        for ax in (ax1, ax2):
+            ax.grid(which='major')
+        ax1.legend(loc='best')
+        fig.suptitle("Keypoint budget for {}".format(detector))
+        plt.tight_layout()
+
+        path = os.path.join("results", "budget", '{}.pdf'.format(detector))
+        ensure_path(path)
+        fig.savefig(path)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+from os.path import join
+import uuid
+
+import cv2
+import numpy as np
+
+from .keypoints import empty, from_cv, to_cv
+from .utils import ensure_path
+
+
+# The layout of the keypoints in a cache entry
+_float_fields = ('x', 'y', 'size', 'angle', 'response')
+_int_fields = ('octave', 'class_id')
+
+class FeatureCache:
+    """
+    On-disk cache of keypoints and descriptors.
+
+    Entries are keyed by the image's contents, the algorithm's name and
+    parameter values, and the OpenCV version. Each entry is a compressed
+    NumPy file, and the least recently used entries are removed once the
+    cache grows beyond max_size bytes.
+
+    Only pass a cache to accuracy tests. Timing runs should not use one, or
+    they would measure the cache instead of the algorithm.
+    """
+    def __init__(self, path=join('results', 'cache'), max_size=2 ** 30):
+        self.path = path
+        self.max_size = max_size
+        ensure_path(join(path, ''))
+
+        self._size = sum(e.stat().st_size for e in self._entries())
+
+    def _entries(self):
+        return [e for e in os.scandir(self.path) if e.name.endswith('.npz')]
+
+    @staticmethod
+    def _params(algo):
+        """Serialise an algorithm's name and parameter values."""
+        fs = cv2.FileStorage('.yml', cv2.FILE_STORAGE_WRITE | cv2.FILE_STORAGE_MEMORY)
+        algo.write(fs, 'params')
+        return algo.getDefaultName() + fs.releaseAndGetString()
+
+    def key(self, stage, image, algo, keypoints=None):
+        """
+        Create the key for a cache entry.
+
+        Parameters
+        ----------
+        stage: str
+            'detect' or 'compute'.
+        image: np.ndarray
+            The image the algorithm runs on.
+        algo: cv2.Feature2D
+            The detector or descriptor.
+        keypoints: list of cv2.KeyPoint, optional
+            The keypoints being described.
+
+        Returns
+        -------
+        str
+            A hex digest identifying the entry.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update('{}\0{}\0{}\0{}\0{}\0'.format(stage, cv2.__version__, self._params(algo),
+                                                image.shape, image.dtype).encode())
+        h.update(np.ascontiguousarray(image).data)
+        if keypoints is not None:
+            for a in self._pack(keypoints):
+                h.update(a.data)
+        return h.hexdigest()
+
+    @staticmethod
+    def _pack(keypoints):
+        keypoints = from_cv(keypoints)
+        floats = np.column_stack([keypoints[name] for name in _float_fields]).reshape(-1, 5)
+        ints = np.column_stack([keypoints[name] for name in _int_fields]).reshape(-1, 2)
+        return floats, ints
+
+    @staticmethod
+    def _unpack(floats, ints):
+        keypoints = empty(len(floats))
+        for i, name in enumerate(_float_fields):
+            keypoints[name] = floats[:, i]
+        for i, name in enumerate(_int_fields):
+            keypoints[name] = ints[:, i]
+        return to_cv(keypoints)
+
+    def load(self, key):
+        """
+        Load an entry from the cache.
+
+        Raises
+        ------
+        KeyError
+            If there is no such entry.
+        """
+        path = join(self.path, key + '.npz')
+        try:
+            with np.load(path) as f:
+                keypoints = self._unpack(f['floats'], f['ints'])
+                descriptors = f['descriptors'] if 'descriptors' in f else None
+        except (FileNotFoundError, ValueError, OSError):
+            raise KeyError(key)
+
+        try:
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:
+            pass
+        return keypoints, descriptors
+
+    def save(self, key, keypoints, descriptors=None):
+        """Save an entry to the cache, evicting old entries if needed."""
+        floats, ints = self._pack(keypoints)
+        arrays = {'floats': floats, 'ints': ints}
+        if descriptors is not None and len(descriptors) > 0:
+            arrays['descriptors'] = np.asarray(descriptors)
+
+        # Write then rename, so that concurrent readers never see half a file
+        path = join(self.path, key + '.npz')
+        tmp = join(self.path, '{}.{}.tmp'.format(key, uuid.uuid4().hex))
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        try:
+            old = os.path.getsize(path)  # The entry being overwritten
+        except FileNotFoundError:
+            old = 0
+        os.replace(tmp, path)
+
+        self._size += os.path.getsize(path) - old
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size."""
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        self._size = sum(e.stat().st_size for e in entries)
+
+        for entry in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            self._size -= entry.stat().st_size
+
+    def detect(self, detector, image):
+        """Run a detector, or get its keypoints from the cache."""
+        key = self.key('detect', image, detector)
+        try:
+            return self.load(key)[0]
+        except KeyError:
+            keypoints = detector.detect(image)
+            self.save(key, keypoints)
+            return keypoints
+
+    def compute(self, descriptor, image, keypoints):
+        """Run a descriptor, or get its keypoints and descriptors from the cache."""
+        key = self.key('compute', image, descriptor, keypoints)
+        try:
+            return self.load(key)
+        except KeyError:
+            keypoints, descriptors = descriptor.compute(image, keypoints)
+            self.save(key, keypoints, descriptors)
+            return keypoints, descriptors
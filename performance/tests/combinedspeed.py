@@ -1,33 +1,50 @@
+import os
 from os.path import join
 from time import perf_counter
 
 from matplotlib import pyplot as plt
-import pandas as pd
 import seaborn as sns
 
 from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .results import ResultsWriter
 from .utils import ensure_path
 
 
-def run_test(images, in_algos):
-    columns = ['algo', 'time', 'nkp']
-    data = []
+def run_test(files, in_algos, store=None, resume=False):
+    """
+    Run the combined speed test
 
-    for algo in in_algos:
-        print("Running test {}".format(algo.detector_s))
+    The colour images are read through an ImageStore, by default a new one.
+    Rows are written to results/combinedspeed.csv as they finish, with the
+    image given by its path. With resume, the (algo, image) units already in
+    that file are skipped.
+    """
+    columns = ['algo', 'image', 'time', 'nkp']
 
-        for image in images:
-            start = perf_counter()
-            kps = algo.detect_and_compute(image)[0]
-            end = perf_counter()
+    if store is None:
+        store = ImageStore()
 
-            time = (end-start) * 1000  # s -> ms
-            nkp = len(kps)
-            data.append([algo.detector_s, time, nkp])
+    with ResultsWriter(join('results', 'combinedspeed.csv'), columns, ['algo', 'image'],
+                       resume=resume) as results:
+        for algo in in_algos:
+            print("Running test {}".format(algo.detector_s))
 
-    df = pd.DataFrame(data, columns=columns)
-    df.to_csv(join('results', 'combinedspeed.csv'))
-    return df
+            for f in files:
+                name = os.path.normpath(f)
+                if results.done(algo.detector_s, name):
+                    continue
+                image = store.image(f, grayscale=False)
+
+                start = perf_counter()
+                kps = algo.detect_and_compute(image)[0]
+                end = perf_counter()
+
+                time = (end-start) * 1000  # s -> ms
+                nkp = len(kps)
+                results.append([algo.detector_s, name, time, nkp])
+
+    return results.read()
 
 
 def generate_plots(data):
@@ -1,100 +1,188 @@
-import re
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
 
 import cv2
-from cv2 import xfeatures2d
+import numpy as np
+
+from .utils import retain_best
+
+
+class Algorithm:
+    """
+    Lazy factory for an OpenCV algorithm.
+
+    The factory function is looked up by name in cv2, then in
+    cv2.xfeatures2d, so that algorithms missing from the installed build
+    can be listed instead of failing at import.
+    """
+    modules = ('', 'xfeatures2d')
+
+    def __init__(self, factory, **params):
+        self.factory = factory
+        self.params = params
+
+    @property
+    def function(self):
+        for name in self.modules:
+            module = getattr(cv2, name) if name else cv2
+            if hasattr(module, self.factory):
+                return getattr(module, self.factory)
+        return None
+
+    @property
+    def available(self):
+        return self.function is not None
+
+    def create(self, **overrides):
+        """Get an instance, shared only within the current thread and process."""
+        params = {**self.params, **overrides}
+        key = (self.factory, tuple(sorted(params.items())))
+
+        instances = _instances()
+        if key not in instances:
+            if not self.available:
+                raise ValueError("{} is not available in this OpenCV build".format(self.factory))
+            instances[key] = self.function(**params)
+        return instances[key]
+
+
+_local = threading.local()
+
+
+def _instances():
+    """Algorithm instances for this thread, cleared in forked processes."""
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.instances = {}
+    return _local.instances
+
+
+_executors = {}
+
+
+def _executor(threads):
+    """
+    Thread pool for tiled detection, shared so that its threads, and so
+    their algorithm instances, last from one image to the next.
+    """
+    key = (os.getpid(), threads)
+    if key not in _executors:
+        _executors[key] = ThreadPoolExecutor(threads)
+    return _executors[key]
+
 
 class DetectorDescriptor:
     detectors = {
-        'Agast': cv2.AgastFeatureDetector_create(),
-        'AKAZE': cv2.AKAZE_create(),
-        'BRISK': cv2.BRISK_create(),
-        'Fast': cv2.FastFeatureDetector_create(),
-        'GFTT': cv2.GFTTDetector_create(),
-        'KAZE': cv2.KAZE_create(),
-        'MSER': cv2.MSER_create(),
-        'ORB': cv2.ORB_create()
+        'Agast': Algorithm('AgastFeatureDetector_create'),
+        'AKAZE': Algorithm('AKAZE_create'),
+        'BRISK': Algorithm('BRISK_create'),
+        'Fast': Algorithm('FastFeatureDetector_create'),
+        'GFTT': Algorithm('GFTTDetector_create'),
+        'KAZE': Algorithm('KAZE_create'),
+        'MSER': Algorithm('MSER_create'),
+        'ORB': Algorithm('ORB_create')
     }
     xdetectors = {
-#        'Boost': xfeatures2d.BoostDesc_create(),
-        'Harris': xfeatures2d.HarrisLaplaceFeatureDetector_create(),
-#        'PCT': xfeatures2d.PCTSignatures_create(),
-        'Star': xfeatures2d.StarDetector_create()
+#        'Boost': Algorithm('BoostDesc_create'),
+        'Harris': Algorithm('HarrisLaplaceFeatureDetector_create'),
+#        'PCT': Algorithm('PCTSignatures_create'),
+        'Star': Algorithm('StarDetector_create')
     }
-    
+
     descriptors = {
-        'AKAZE': None,
-        'BRISK': cv2.BRISK_create(),
-        'KAZE': None,
-        'ORB': cv2.ORB_create(),
+        'AKAZE': Algorithm('AKAZE_create'),
+        'BRISK': Algorithm('BRISK_create'),
+        'KAZE': Algorithm('KAZE_create'),
+        'ORB': Algorithm('ORB_create'),
     }
     xdescriptors = {
-#        'Boost': xfeatures2d.BoostDesc_create(),
-        'BRIEF': xfeatures2d.BriefDescriptorExtractor_create(),
-        'DAISY': xfeatures2d.DAISY_create(),
-        'FREAK': xfeatures2d.FREAK_create(),
-        'LATCH': xfeatures2d.LATCH_create(),
-#        'LUCID': xfeatures2d.LUCID_create(),
-        'VGG': xfeatures2d.VGG_create()
+#        'Boost': Algorithm('BoostDesc_create'),
+        'BRIEF': Algorithm('BriefDescriptorExtractor_create'),
+        'DAISY': Algorithm('DAISY_create'),
+        'FREAK': Algorithm('FREAK_create'),
+        'LATCH': Algorithm('LATCH_create'),
+#        'LUCID': Algorithm('LUCID_create'),
+        'VGG': Algorithm('VGG_create')
     }
 
-    def __init__(self, det_s, des_s=None):
-        self._string_re = re.compile(r'<([^\W_]+)_?(\w+)?')
+    @classmethod
+    def detector_names(cls, full=False):
+        """Names of the detectors which the installed OpenCV provides."""
+        algos = {**cls.detectors, **cls.xdetectors} if full else cls.detectors
+        return [name for name, algo in algos.items() if algo.available]
+
+    @classmethod
+    def descriptor_names(cls, full=False):
+        """Names of the descriptors which the installed OpenCV provides."""
+        algos = {**cls.descriptors, **cls.xdescriptors} if full else cls.descriptors
+        return [name for name, algo in algos.items() if algo.available]
+
+    @classmethod
+    def available(cls):
+        """Whether the installed OpenCV provides each algorithm."""
+        groups = ('detectors', 'xdetectors', 'descriptors', 'xdescriptors')
+        return {group: {name: algo.available for name, algo in getattr(cls, group).items()}
+                for group in groups}
+
+    def __init__(self, det_s, des_s=None, cache=None, det_params=None, des_params=None):
+        """
+        cache is an optional FeatureCache, used by detect() and compute().
+        det_params and des_params override the algorithms' default parameters.
+        """
+        self._det_s = det_s
+        self._des_s = des_s
 
         try:
-            self.det = self.detectors[det_s]
+            det = self.detectors[det_s]
         except KeyError:
             try:
-                self.det = self.xdetectors[det_s]
+                det = self.xdetectors[det_s]
             except KeyError:
                 raise ValueError("Unsupported detector")
+        self._det_algo = det
+        self._det_params = det_params or {}
+        self.det = det.create(**self._det_params)
 
         if des_s:
             try:
-                self.desc = self.descriptors[des_s]
+                desc = self.descriptors[des_s]
             except KeyError:
                 try:
-                    self.desc = self.xdescriptors[des_s]
+                    desc = self.xdescriptors[des_s]
                 except KeyError:
                     raise ValueError("Unsupported descriptor")
 
-            # AKAZE and KAZE special case
-            if self.desc is None:
-                self.desc = self._create_kaze_descriptor(des_s)
-        else:
-            self.desc = None
-
-    def _create_kaze_descriptor(self, des_s):
-        """AKAZE only allows AKAZE or KAZE detectors."""
+            self._desc_algo = desc
+            self._desc_params = des_params or {}
 
-        if isinstance(self.det, cv2.AKAZE) or isinstance(self.det, cv2.KAZE):
-            if des_s == 'AKAZE':
-                return cv2.AKAZE_create()
+            # AKAZE only allows AKAZE or KAZE detectors
+            if des_s in ('AKAZE', 'KAZE') and det_s not in ('AKAZE', 'KAZE'):
+                self.desc = None
             else:
-                return cv2.KAZE_create()
+                self.desc = desc.create(**self._desc_params)
         else:
-            return None
+            self.desc = None
 
-    def _stringify(self, obj):
-        match = self._string_re.match(str(obj))
-        if match.group(2):      # In the case of 'xfeatures2d_SIFT' etc.
-            return match.group(2)
-        else:
-            return match.group(1)
+        self.cache = cache
 
     @property
     def detector_s(self):
-        return self._stringify(self.det)
+        return self._det_s
 
     @property
     def descriptor_s(self):
-        return self._stringify(self.desc)
+        return self._des_s if self.desc is not None else None
 
     def detect_and_compute(self, image):
         return self.det.detectAndCompute(image, None)
 
     def detect(self, image):
         try:
-            keypoints = self.det.detect(image)
+            if self.cache is not None:
+                keypoints = self.cache.detect(self.det, image)
+            else:
+                keypoints = self.det.detect(image)
         except:
             return ([])
         else:
@@ -102,8 +190,127 @@ class DetectorDescriptor:
 
     def compute(self, image, keypoints):
         try:
-            (keypoints, descriptors) = self.desc.compute(image, keypoints)
+            if self.cache is not None:
+                (keypoints, descriptors) = self.cache.compute(self.desc, image, keypoints)
+            else:
+                (keypoints, descriptors) = self.desc.compute(image, keypoints)
         except:
             return ([], [])
         else:
             return (keypoints, descriptors)
+
+    def _tiles(self, shape, tiles, overlap):
+        """
+        Split an image into tiles.
+
+        Each tile owns a core, and the cores cover the image without
+        overlapping. The tile itself is its core grown by overlap pixels on
+        each side, so that keypoints and descriptors near the edges of its
+        core see the same neighbourhood as in the whole image.
+
+        Returns
+        -------
+        list of tuple
+            The (y0, y1, x0, x1) bounds of each tile and of its core.
+        """
+        rows, cols = shape[:2]
+        ys = np.linspace(0, rows, tiles[0] + 1).round().astype(int).tolist()
+        xs = np.linspace(0, cols, tiles[1] + 1).round().astype(int).tolist()
+
+        bounds = []
+        for y0, y1 in zip(ys[:-1], ys[1:]):
+            for x0, x1 in zip(xs[:-1], xs[1:]):
+                tile = (max(y0 - overlap, 0), min(y1 + overlap, rows),
+                        max(x0 - overlap, 0), min(x1 + overlap, cols))
+                bounds.append((tile, (y0, y1, x0, x1)))
+        return bounds
+
+    def _process_tile(self, image, tile, core, describe):
+        """Detect, and maybe describe, the keypoints in the core of a tile."""
+        ty0, ty1, tx0, tx1 = tile
+        y0, y1, x0, x1 = core
+        patch = image[ty0:ty1, tx0:tx1]
+
+        # Instances are per thread, so the tiles can be processed in parallel
+        try:
+            keypoints = self._det_algo.create(**self._det_params).detect(patch)
+        except:
+            keypoints = []
+
+        # Each keypoint belongs to the tile whose core it is in, which
+        # removes the duplicates found in the overlaps
+        pts = np.reshape(cv2.KeyPoint_convert(keypoints), (-1, 2)) + (tx0, ty0)
+        inside = (pts[:, 0] >= x0) & (pts[:, 0] < x1) & (pts[:, 1] >= y0) & (pts[:, 1] < y1)
+        owned = [keypoints[i] for i in np.flatnonzero(inside)]
+
+        descriptors = None
+        if describe and owned:
+            try:
+                owned, descriptors = self._desc_algo.create(**self._desc_params).compute(patch, owned)
+            except:
+                owned, descriptors = [], None
+
+        for kp in owned:
+            kp.pt = (kp.pt[0] + tx0, kp.pt[1] + ty0)
+        return list(owned), descriptors
+
+    def _tiled(self, image, tiles, overlap, max_keypoints, threads, describe):
+        bounds = self._tiles(image.shape, tiles, overlap)
+        parts = list(_executor(threads).map(lambda b: self._process_tile(image, *b, describe), bounds))
+
+        keypoints = [kp for kps, _ in parts for kp in kps]
+        descriptors = [des for _, des in parts if des is not None and len(des) > 0]
+        descriptors = np.concatenate(descriptors) if descriptors else None
+
+        if max_keypoints is not None and len(keypoints) > max_keypoints:
+            best = retain_best(keypoints, max_keypoints)
+            keypoints = [keypoints[i] for i in best]
+            if descriptors is not None:
+                descriptors = descriptors[best]
+
+        return keypoints, descriptors
+
+    def detect_tiled(self, image, tiles=(2, 2), overlap=32, max_keypoints=None, threads=None):
+        """
+        Detect keypoints in overlapping tiles of an image, on a thread pool.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            The image.
+        tiles: tuple
+            The number of (rows, columns) of tiles.
+        overlap: int
+            How many pixels each tile extends past its share of the image.
+        max_keypoints: int
+            How many of the keypoints with the strongest response to keep,
+            or None to keep them all.
+        threads: int
+            The number of threads, or None for the ThreadPoolExecutor default.
+
+        Returns
+        -------
+        list of cv2.KeyPoint
+            The keypoints, in whole image coordinates.
+        """
+        return self._tiled(image, tiles, overlap, max_keypoints, threads, describe=False)[0]
+
+    def detect_and_compute_tiled(self, image, tiles=(2, 2), overlap=32, max_keypoints=None,
+                                 threads=None):
+        """
+        Detect and describe keypoints in overlapping tiles of an image.
+
+        Takes the same parameters as detect_tiled(). Keypoints near the edge
+        of a tile may be dropped by the descriptor if overlap is smaller
+        than its patch.
+
+        Returns
+        -------
+        keypoints: list of cv2.KeyPoint
+            The keypoints, in whole image coordinates.
+        descriptors: np.ndarray
+            Their descriptors, or None if there are none.
+        """
+        if self.desc is None:
+            raise ValueError("No descriptor to compute with")
+        return self._tiled(image, tiles, overlap, max_keypoints, threads, describe=True)
@@ -0,0 +1,109 @@
+import copy
+from functools import lru_cache
+import os
+import re
+
+import numpy as np
+from scipy import linalg
+
+from .utils import image_re, transform_points
+
+
+h_re = re.compile(r'H1to(\d+)p$')
+
+
+def scale_homography(h, factor):
+    """
+    Scale a homography for images resized by a factor.
+
+    If h maps img1 to image n, the result maps img1 resized by factor to
+    image n resized by factor, i.e. S h S^-1. S scales about the pixel
+    centres, as cv2.resize() does.
+    """
+    offset = (factor - 1) / 2
+    s = np.array([[factor, 0, offset], [0, factor, offset], [0, 0, 1]])
+    return s @ h @ linalg.inv(s)
+
+
+def scaled_shape(shape, factor):
+    """The (rows, cols) of an image of a given shape resized by a factor."""
+    return tuple(int(round(d * factor)) for d in shape[:2])
+
+
+class SequenceGeometry:
+    """
+    The homographies of an image sequence, and the area its images share.
+
+    Image n's area of img1 is where the homography maps img1's pixels inside
+    image n's bounds, so it is tested from the homography and the image
+    shape instead of a full-frame mask.
+    """
+    def __init__(self, directory, shape):
+        self.directory = directory
+        self.shape = tuple(shape[:2])
+
+        self.h = {1: np.eye(3)}
+        for f in os.listdir(directory):
+            match = h_re.match(f)
+            if match:
+                self.h[int(match.group(1))] = np.loadtxt(os.path.join(directory, f))
+        self.hi = {n: linalg.inv(h) for n, h in self.h.items()}
+
+    def common(self, pts, n):
+        """
+        Test which points of img1 are also visible in image n.
+
+        This matches points_in_mask() with the mask from create_mask(shape, hi),
+        apart from rounding in a few pixels along the boundary.
+
+        Parameters
+        ----------
+        pts: array_like
+            The (N, 2) points in img1, as (x, y).
+        n: int
+            The image number.
+
+        Returns
+        -------
+        np.ndarray
+            The (N,) booleans saying whether each point is in the common area.
+        """
+        rows, cols = self.shape
+        pts = np.rint(np.asarray(pts, np.float64).reshape(-1, 2))
+        with np.errstate(invalid='ignore'):
+            inside = ((pts[:, 0] >= 0) & (pts[:, 1] >= 0) &
+                      (pts[:, 0] < cols) & (pts[:, 1] < rows))
+
+            # The mask is bilinearly interpolated, so pixels count up to half a pixel outside
+            t = transform_points(pts[inside], self.h[n])
+            inside[inside] = ((t[:, 0] > -0.5) & (t[:, 1] > -0.5) &
+                              (t[:, 0] < cols - 0.5) & (t[:, 1] < rows - 0.5))
+        return inside
+
+    def scaled(self, factor):
+        """The geometry of the sequence with its images resized by a factor."""
+        geometry = copy.copy(self)
+        geometry.shape = scaled_shape(self.shape, factor)
+        geometry.h = {n: scale_homography(h, factor) for n, h in self.h.items()}
+        geometry.hi = {n: scale_homography(hi, factor) for n, hi in self.hi.items()}
+        return geometry
+
+
+@lru_cache(maxsize=None)
+def sequence_geometry(directory, shape):
+    """
+    Get the geometry of a sequence, which is only loaded once.
+
+    Parameters
+    ----------
+    directory: str
+        The sequence's directory.
+    shape: tuple
+        The shape of img1's ndarray.
+    """
+    return SequenceGeometry(directory, shape)
+
+
+def image_number(path):
+    """Get an image's number in its sequence, e.g. 3 for 'bark/img3.ppm'."""
+    return int(image_re.match(os.path.basename(path)).group(1))
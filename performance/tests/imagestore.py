@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+from os.path import abspath, basename, dirname, getmtime, isfile, join
+import tempfile
+
+import cv2
+import numpy as np
+
+from .utils import ensure_path
+
+
+class ImageStore:
+    """
+    Decoded images of the benchmark sequences, in memory-mapped files.
+
+    Each sequence directory (bark, bikes, boat, ...) is decoded once into a
+    grayscale and a colour uint8 file, which is rebuilt if the images
+    change. Images are handed out as read-only views of those files, so
+    repeated runs and worker processes share the same pages instead of
+    each decoding their own copy.
+
+    A store checks each directory for changes once, the first time it is
+    used, so make a new store to see images changed since.
+    """
+    exts = ('pgm', 'ppm')
+    modes = {'gray': cv2.IMREAD_GRAYSCALE, 'colour': cv2.IMREAD_COLOR}
+
+    def __init__(self, path=join('results', 'images')):
+        self.path = path
+        self._maps = {}
+        ensure_path(join(path, ''))
+
+    def _sources(self, directory):
+        files = sorted(f for f in os.listdir(directory) if f.endswith(self.exts))
+        return {f: getmtime(join(directory, f)) for f in files}
+
+    def _index_path(self, directory, mode):
+        # Named after the whole path, so that directories with the same name don't collide
+        directory = abspath(directory)
+        digest = hashlib.blake2b(directory.encode(), digest_size=8).hexdigest()
+        return join(self.path, '{}-{}.{}.json'.format(basename(directory), digest, mode))
+
+    def _build(self, directory, mode, sources):
+        """Decode a sequence into one flat uint8 file, with a JSON index."""
+        index_path = self._index_path(directory, mode)
+        data_path = index_path[:-len('json')] + 'u8'
+
+        images = {}
+        offset = 0
+        # Written under a unique name then renamed, so that concurrent builds don't race
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp', delete=False) as f:
+            for name in sources:
+                image = cv2.imread(join(directory, name), self.modes[mode])
+                if image is None:
+                    raise ValueError("Could not decode {}".format(join(directory, name)))
+                f.write(np.ascontiguousarray(image).data)
+                images[name] = {'offset': offset, 'shape': image.shape}
+                offset += image.nbytes
+        os.replace(f.name, data_path)
+
+        index = {'directory': abspath(directory), 'data': basename(data_path),
+                 'sources': sources, 'images': images}
+        with tempfile.NamedTemporaryFile('w', dir=self.path, suffix='.tmp', delete=False) as f:
+            json.dump(index, f)
+        os.replace(f.name, index_path)
+        return index
+
+    def _load(self, directory, mode):
+        """Get a sequence's index and memory map, building them if needed."""
+        key = (abspath(directory), mode)
+        if key in self._maps:
+            return self._maps[key]
+        sources = self._sources(directory)
+
+        index_path = self._index_path(directory, mode)
+        index = None
+        if isfile(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['directory'] != abspath(directory) or index['sources'] != sources:
+                index = None
+        if index is None:
+            index = self._build(directory, mode, sources)
+
+        data = np.memmap(join(self.path, index['data']), np.uint8, 'r')
+        self._maps[key] = (index, data)
+        return self._maps[key]
+
+    def sequence(self, directory, grayscale=True):
+        """
+        Get all of the images in a sequence directory.
+
+        Parameters
+        ----------
+        directory: str
+            The sequence's directory, e.g. 'bark'.
+        grayscale: bool
+            Whether to get the grayscale or colour images.
+
+        Returns
+        -------
+        list of np.ndarray
+            Read-only views of the images, sorted by filename.
+        """
+        index, data = self._load(directory, 'gray' if grayscale else 'colour')
+        return [self._view(data, index['images'][name]) for name in index['sources']]
+
+    def image(self, path, grayscale=True):
+        """
+        Get one image, as a read-only view.
+
+        Parameters
+        ----------
+        path: str
+            The image's path, inside a sequence directory.
+        grayscale: bool
+            Whether to get the grayscale or colour image.
+        """
+        index, data = self._load(dirname(path) or '.', 'gray' if grayscale else 'colour')
+        return self._view(data, index['images'][basename(path)])
+
+    def images(self, paths, grayscale=True):
+        """Get read-only views of several images."""
+        return [self.image(path, grayscale) for path in paths]
+
+    @staticmethod
+    def _view(data, entry):
+        shape = tuple(entry['shape'])
+        return data[entry['offset']:entry['offset'] + int(np.prod(shape))].reshape(shape)
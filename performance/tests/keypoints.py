@@ -0,0 +1,123 @@
+"""
+Keypoints as NumPy structured arrays.
+
+A list of cv2.KeyPoint costs a Python object per keypoint, and every use of
+their positions or sizes rebuilds an array from it. These functions convert
+a list to a structured array once, with a field per KeyPoint attribute, so
+that the rest of the evaluation can index, mask and sort it like any other
+array, and convert it back when OpenCV needs KeyPoints again.
+"""
+from operator import attrgetter
+
+import cv2
+import numpy as np
+
+
+keypoint_dtype = np.dtype([
+    ('x', np.float32),
+    ('y', np.float32),
+    ('size', np.float32),
+    ('angle', np.float32),
+    ('response', np.float32),
+    ('octave', np.int32),
+    ('class_id', np.int32),
+])
+
+
+def empty(n=0):
+    """An array of n keypoints, all zero."""
+    return np.zeros(n, keypoint_dtype)
+
+
+def from_cv(keypoints, fields=None):
+    """
+    Convert OpenCV keypoints to a structured array.
+
+    The positions are converted by OpenCV, but every other attribute costs a
+    pass over the keypoints in Python, so only those in fields are.
+
+    Parameters
+    ----------
+    keypoints: list of cv2.KeyPoint
+        The keypoints.
+    fields: sequence of str, optional
+        The attributes to convert besides x and y, by default all of them.
+        The others are left zero.
+
+    Returns
+    -------
+    np.ndarray
+        The (N,) keypoints, with keypoint_dtype.
+    """
+    if isinstance(keypoints, np.ndarray) and keypoints.dtype == keypoint_dtype:
+        return keypoints
+    if fields is None:
+        fields = ('size', 'angle', 'response', 'octave', 'class_id')
+
+    # A field at a time is several times faster than a tuple per keypoint
+    array = empty(len(keypoints))
+    pts = _convert(keypoints)
+    array['x'] = pts[:, 0]
+    array['y'] = pts[:, 1]
+    for name in fields:
+        array[name] = np.fromiter(map(attrgetter(name), keypoints), keypoint_dtype[name],
+                                  len(keypoints))
+    return array
+
+
+def to_cv(keypoints):
+    """Convert a structured array to a list of OpenCV keypoints."""
+    return [cv2.KeyPoint(x, y, size, angle, response, octave, class_id)
+            for x, y, size, angle, response, octave, class_id in keypoints.tolist()]
+
+
+def points(keypoints):
+    """
+    The (N, 2) float64 positions of keypoints, as (x, y).
+
+    keypoints is a structured array, or a list of cv2.KeyPoint, which is
+    converted by OpenCV without building the rest of the array.
+    """
+    if not isinstance(keypoints, np.ndarray):
+        return _convert(keypoints).astype(np.float64)
+    pts = np.empty((len(keypoints), 2))
+    pts[:, 0] = keypoints['x']
+    pts[:, 1] = keypoints['y']
+    return pts
+
+
+def _convert(keypoints):
+    """The (N, 2) float32 positions of a list of cv2.KeyPoint."""
+    # KeyPoint_convert gives an empty tuple for no keypoints
+    return np.reshape(cv2.KeyPoint_convert(keypoints), (-1, 2))
+
+
+def sort_by_response(keypoints):
+    """The keypoints from the strongest response to the weakest, keeping the order of ties."""
+    return keypoints[np.argsort(-keypoints['response'], kind='stable')]
+
+
+def strongest(keypoints, n):
+    """
+    The n keypoints with the strongest responses, in their original order.
+
+    Ties with the nth strongest are broken by keeping the earlier keypoints.
+    """
+    if len(keypoints) <= n:
+        return keypoints
+    best = np.argsort(-keypoints['response'], kind='stable')[:n]
+    return keypoints[np.sort(best)]
+
+
+def shifted(keypoints, dx, dy):
+    """The keypoints moved by (dx, dy)."""
+    keypoints = keypoints.copy()
+    keypoints['x'] += dx
+    keypoints['y'] += dy
+    return keypoints
+
+
+def in_rect(keypoints, x0, y0, x1, y1):
+    """Booleans saying which keypoints are inside [x0, x1) x [y0, y1)."""
+    return ((keypoints['x'] >= x0) & (keypoints['x'] < x1) &
+            (keypoints['y'] >= y0) & (keypoints['y'] < y1))
@@ -0,0 +1,188 @@
+import json
+
+import cv2
+import numpy as np
+
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+class Matcher:
+    """
+    Descriptor matcher with a selectable strategy and mode.
+
+    Strategies
+    ----------
+    bf: brute force, with the L2 norm for float descriptors and the Hamming
+        norm for binary ones.
+    flann-kd: FLANN randomised KD-trees, for float descriptors.
+    flann-lsh: FLANN locality sensitive hashing, for binary descriptors.
+
+    Modes
+    -----
+    best: the nearest train descriptor for every query descriptor.
+    ratio: the two nearest neighbours, keeping the nearest only if it is
+        closer than ratio times the second.
+    crosscheck: only matches which are also the nearest in the other
+        direction.
+    """
+    strategies = ('bf', 'flann-kd', 'flann-lsh')
+    modes = ('best', 'ratio', 'crosscheck')
+
+    def __init__(self, strategy='bf', mode='best', ratio=0.8, index_params=None, search_params=None):
+        if strategy not in self.strategies:
+            raise ValueError("Unsupported matcher strategy")
+        if mode not in self.modes:
+            raise ValueError("Unsupported matcher mode")
+
+        self.strategy = strategy
+        self.mode = mode
+        self.ratio = ratio
+
+        if index_params is None:
+            if strategy == 'flann-kd':
+                index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=4)
+            else:
+                index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12,
+                                    multi_probe_level=1)
+        self.index_params = index_params
+        self.search_params = search_params or dict(checks=50)
+
+    @property
+    def name(self):
+        return self.strategy if self.mode == 'best' else '{}+{}'.format(self.strategy, self.mode)
+
+    def supports(self, dtype):
+        """Whether the strategy works with descriptors of a given dtype."""
+        binary = np.dtype(dtype) == np.uint8
+        return (self.strategy == 'bf' or
+                (self.strategy == 'flann-kd' and not binary) or
+                (self.strategy == 'flann-lsh' and binary))
+
+    def create(self, dtype, cross_check=False):
+        """Create the OpenCV matcher for descriptors of a given dtype."""
+        if not self.supports(dtype):
+            raise ValueError("{} does not support {} descriptors".format(self.strategy, np.dtype(dtype)))
+
+        if self.strategy == 'bf':
+            norm = cv2.NORM_HAMMING if np.dtype(dtype) == np.uint8 else cv2.NORM_L2
+            return cv2.BFMatcher(norm, crossCheck=cross_check)
+        else:
+            return cv2.FlannBasedMatcher(self.index_params, self.search_params)
+
+    def match(self, des1, des2):
+        """
+        Match query descriptors against train descriptors.
+
+        Parameters
+        ----------
+        des1: np.ndarray
+            The query descriptors.
+        des2: np.ndarray
+            The train descriptors.
+
+        Returns
+        -------
+        list of cv2.DMatch
+            The matches, with queryIdx into des1 and trainIdx into des2.
+        """
+        if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
+            return []
+
+        if self.mode == 'best':
+            return list(self.create(des1.dtype).match(des1, des2))
+
+        elif self.mode == 'ratio':
+            matches = self.create(des1.dtype).knnMatch(des1, des2, 2)
+            return [m[0] for m in matches
+                    if len(m) == 2 and m[0].distance < self.ratio * m[1].distance]
+
+        else:  # crosscheck
+            if self.strategy == 'bf':
+                return list(self.create(des1.dtype, cross_check=True).match(des1, des2))
+
+            forward = self.create(des1.dtype).match(des1, des2)
+            backward = self.create(des1.dtype).match(des2, des1)
+            nearest = np.full(len(des2), -1)
+            nearest[[m.queryIdx for m in backward]] = [m.trainIdx for m in backward]
+            return [m for m in forward if nearest[m.trainIdx] == m.queryIdx]
+
+    def train(self, des):
+        """Build an index of train descriptors once, to match many queries against."""
+        return TrainedMatcher(self, des)
+
+
+class TrainedMatcher:
+    """
+    A matcher with its index built once over a fixed set of train descriptors.
+
+    Matcher.match() builds a new index over the train descriptors on every
+    call, which is wasted when they do not change, as with a tracker's
+    target. Each query here only searches the index. Only the best and
+    ratio modes are supported, as a cross check would need an index of every
+    query too.
+
+    save() writes the train descriptors and the matcher's settings, and
+    load() rebuilds the index from them. The index structure itself is not
+    written, as OpenCV cannot reliably reload a saved LSH index.
+    """
+    def __init__(self, matcher, des):
+        if matcher.mode == 'crosscheck':
+            raise ValueError("A trained matcher does not support cross checking")
+        if des is None or len(des) == 0:
+            raise ValueError("No descriptors to train on")
+
+        self.matcher = matcher
+        self.des = des
+        self._index = matcher.create(des.dtype)
+        self._index.add([des])
+        self._index.train()
+
+    def match(self, des):
+        """
+        Match query descriptors against the trained ones.
+
+        Returns
+        -------
+        list of cv2.DMatch
+            The matches, with queryIdx into des and trainIdx into the trained
+            descriptors.
+        """
+        if des is None or len(des) == 0:
+            return []
+
+        if self.matcher.mode == 'best':
+            return list(self._index.match(des))
+        else:
+            matches = self._index.knnMatch(des, 2)
+            return [m[0] for m in matches
+                    if len(m) == 2 and m[0].distance < self.matcher.ratio * m[1].distance]
+
+    def save(self, file, **arrays):
+        """Save the trained matcher to a NumPy file, along with any other arrays."""
+        m = self.matcher
+        settings = dict(strategy=m.strategy, mode=m.mode, ratio=m.ratio,
+                        index_params=m.index_params, search_params=m.search_params)
+        np.savez(file, descriptors=self.des, matcher=json.dumps(settings), **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a trained matcher saved by save().
+
+        Returns
+        -------
+        (TrainedMatcher, dict)
+            The trained matcher, and the other arrays saved with it.
+        """
+        with np.load(file) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        settings = json.loads(str(arrays.pop('matcher')))
+        return cls(Matcher(**settings), arrays.pop('descriptors')), arrays
+
+
+def create_matchers(ratio=0.8):
+    """Create a matcher for every combination of strategy and mode."""
+    return [Matcher(strategy, mode, ratio) for strategy in Matcher.strategies for mode in Matcher.modes]
@@ -0,0 +1,181 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .benchmark import time_call
+from .detectordescriptor import DetectorDescriptor
+from .geometry import image_number, sequence_geometry
+from .imagestore import ImageStore
+from .keypoints import from_cv, points
+from .matchers import create_matchers
+from .results import ResultsWriter
+from .utils import ensure_path, homography_jacobians, overlap_error, transform_points
+
+
+def _regions(kps):
+    kps = from_cv(kps, ('size',))
+    return points(kps), kps['size'].astype(np.float64)
+
+
+def count_correspondences(kps1, kps2, geometry, n, max_error=0.4):
+    """
+    Count the pairs of keypoints whose regions overlap, in the common area.
+
+    Parameters
+    ----------
+    kps1: np.ndarray or list of cv2.KeyPoint
+        Keypoints in img1, see tests.keypoints.
+    kps2: np.ndarray or list of cv2.KeyPoint
+        Keypoints in image n.
+    geometry: SequenceGeometry
+        The sequence's geometry.
+    n: int
+        The number of the second image.
+    max_error: float
+        The largest overlap error of a correspondence.
+    """
+    pts1, sizes1 = _regions(kps1)
+    pts2, sizes2 = _regions(kps2)
+    tpts2 = transform_points(pts2, geometry.hi[n])
+
+    in1 = np.flatnonzero(geometry.common(pts1, n))
+    in2 = np.flatnonzero(geometry.common(tpts2, n))
+    if len(in1) == 0 or len(in2) == 0:
+        return 0
+
+    # Regions with a small enough overlap error have areas within a factor of
+    # 1 - max_error, and centres closer than the radius of the first plus the
+    # semi-major axis of the second's mapped ellipse, which may be far from round
+    jac = homography_jacobians(pts2[in2], geometry.hi[n])
+    semi_major = np.linalg.norm(jac, 2, axis=(1, 2)) * sizes2[in2] / 2
+    radius = np.sqrt(np.abs(np.linalg.det(jac))) * sizes2[in2] / 2  # Of a circle of the same area
+    reach = semi_major + radius / np.sqrt(1 - max_error) + 1
+
+    tree = cKDTree(pts1[in1])
+    near = tree.query_ball_point(tpts2[in2], reach)
+    i2 = np.repeat(in2, [len(j) for j in near])
+    i1 = in1[np.concatenate([np.asarray(j, int) for j in near])] if len(i2) else np.empty(0, int)
+
+    errors = overlap_error(pts1[i1], sizes1[i1], pts2[i2], sizes2[i2], geometry.hi[n])
+    return int(np.count_nonzero(errors < max_error))
+
+
+def correct_matches(kps1, kps2, matches, geometry, n, max_error=0.4):
+    """
+    Check matches against the ground truth homography.
+
+    Returns
+    -------
+    common: np.ndarray
+        Booleans saying which matches are in the common area.
+    correct: np.ndarray
+        Booleans saying which matches are correct.
+    """
+    qidx = np.array([m.queryIdx for m in matches], int)
+    tidx = np.array([m.trainIdx for m in matches], int)
+    pts1, sizes1 = _regions(kps1)
+    pts2, sizes2 = _regions(kps2)
+    pts1, sizes1, pts2, sizes2 = pts1[qidx], sizes1[qidx], pts2[tidx], sizes2[tidx]
+
+    common = geometry.common(pts1, n) & geometry.common(transform_points(pts2, geometry.hi[n]), n)
+    correct = np.zeros(len(matches), bool)
+    correct[common] = overlap_error(pts1[common], sizes1[common], pts2[common], sizes2[common],
+                                    geometry.hi[n]) < max_error
+    return common, correct
+
+
+def run_test(files, detector='ORB', full=False, matchers=None, repeat=3, store=None, resume=False):
+    """
+    Run the matcher benchmark
+
+    Every matcher which supports a descriptor's type is timed matching
+    img1 of each sequence against the others, and its matches are checked
+    against the ground truth. The time is the fastest of repeat runs.
+    """
+    columns = ['descriptor', 'matcher', 'sequence', 'image', 'time', 'matches', 'common',
+               'correct', 'correspondences']
+
+    if matchers is None:
+        matchers = create_matchers()
+    if store is None:
+        store = ImageStore()
+
+    results = ResultsWriter(os.path.join('results', 'matching.csv'), columns,
+                            ['descriptor', 'matcher', 'sequence', 'image'], resume=resume)
+    with results:
+        for descriptor in DetectorDescriptor.descriptor_names(full):
+            algo = DetectorDescriptor(detector, descriptor)
+            if algo.desc is None:
+                continue
+            print("Running test {}".format(descriptor))
+
+            for f in files:
+                sequence = os.path.basename(os.path.dirname(os.path.abspath(f)))
+                filename = os.path.basename(f).split('.')[0]
+                image = store.image(f)
+                n = image_number(f)
+
+                kps, des = algo.compute(image, algo.detect(image))
+                kps = from_cv(kps, ('size',))  # Only the regions are needed
+                if n == 1:
+                    geometry = sequence_geometry(os.path.abspath(os.path.dirname(f)), image.shape[:2])
+                    basekps, basedes = kps, des
+                    continue
+
+                if des is None or basedes is None or len(des) == 0 or len(basedes) == 0:
+                    continue
+                correspondences = count_correspondences(basekps, kps, geometry, n)
+
+                for matcher in matchers:
+                    if not matcher.supports(des.dtype) or results.done(descriptor, matcher.name,
+                                                                       sequence, filename):
+                        continue
+
+                    matches, times = time_call(matcher.match, basedes, des, repeat=repeat)
+                    common, correct = correct_matches(basekps, kps, matches, geometry, n)
+                    results.append([descriptor, matcher.name, sequence, filename, times.min(),
+                                    len(matches), np.count_nonzero(common),
+                                    np.count_nonzero(correct), correspondences])
+
+    df = results.read()
+    df['precision'] = df['correct'] / df['common']
+    df['recall'] = df['correct'] / df['correspondences']
+    return df
+
+
+def fastest(df, min_precision=0, min_recall=0):
+    """
+    Find the fastest matcher for each descriptor which meets an accuracy bar.
+
+    Returns
+    -------
+    pd.DataFrame
+        The average time, precision and recall of the chosen matchers.
+    """
+    summary = df.groupby(['descriptor', 'matcher'])[['time', 'precision', 'recall']].mean()
+    good = summary[(summary.precision >= min_precision) & (summary.recall >= min_recall)]
+    return good.sort_values('time').groupby(level='descriptor').head(1).sort_index()
+
+
+def generate_plots(df):
+    """Plot matching time against precision and recall for each descriptor."""
+    summary = df.groupby(['descriptor', 'matcher'])[['time', 'precision', 'recall']].mean()
+
+    for descriptor, data in summary.groupby(level='descriptor'):
+        fig, axes = plt.subplots(1, 2, figsize=(10, 4), sharex=True)
+
+        for ax, measure in zip(axes, ('precision', 'recall')):
+            for (_, matcher), row in data.iterrows():
+                ax.scatter(row.time, row[measure], label=matcher)
+            ax.set(xlabel="Matching time / ms", ylabel=measure.capitalize(), xscale='log')
+            ax.grid(which='major')
+
+        axes[0].legend(loc='best')
+        fig.suptitle("Matchers for {}".format(descriptor))
+        plt.tight_layout()
+
+        path = os.path.join("results", "matching", '{}.pdf'.format(descriptor))
+        ensure_path(path)
+        fig.savefig(path)
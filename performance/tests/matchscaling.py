@@ -0,0 +1,138 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+
+from .benchmark import time_call
+from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .matchers import Matcher
+from .memory import peak_memory
+from .results import ResultsWriter
+from .utils import ensure_path
+
+
+def extract_descriptors(images, detector='ORB', full=True):
+    """
+    Extract the descriptors of every descriptor type from some images.
+
+    AKAZE and KAZE descriptors are extracted from their own keypoints, as
+    they don't work with other detectors.
+
+    Returns
+    -------
+    dict
+        Each descriptor type's descriptors from all of the images, stacked.
+    """
+    descriptors = {}
+    for descriptor in DetectorDescriptor.descriptor_names(full):
+        det_s = descriptor if descriptor in ('AKAZE', 'KAZE') else detector
+        algo = DetectorDescriptor(det_s, descriptor)
+
+        des = [algo.compute(image, algo.detect(image))[1] for image in images]
+        des = [d for d in des if d is not None and len(d) > 0]
+        if des:
+            descriptors[descriptor] = np.concatenate(des)
+    return descriptors
+
+
+def resize_descriptors(des, n, rng):
+    """
+    Subsample or replicate descriptors to get n of them.
+
+    Replicas are perturbed, by flipping a few bits of binary descriptors
+    and adding a little noise to float ones, so that they aren't exact
+    duplicates which would make the search unrealistically easy.
+    """
+    if n <= len(des):
+        return des[rng.choice(len(des), n, replace=False)]
+
+    extra = des[rng.integers(len(des), size=n - len(des))]
+    if des.dtype == np.uint8:
+        flips = rng.random((len(extra), des.shape[1] * 8)) < 0.05
+        extra = extra ^ np.packbits(flips, axis=1)
+    else:
+        noise = rng.normal(0, 0.05, extra.shape) * des.std(axis=0)
+        extra = (extra + noise).astype(des.dtype)
+    return np.concatenate([des, extra])
+
+
+def _count_matches(matcher, query, train):
+    return len(matcher.match(query, train))
+
+
+def run_test(files, sizes=(1000, 5000, 20000, 50000, 100000, 200000), queries=1000,
+             detector='ORB', matchers=None, repeat=3, memory=True, seed=0, store=None, resume=False):
+    """
+    Run the matching throughput benchmark
+
+    Images are read through an ImageStore, by default a new one. For each
+    descriptor type, the descriptors from the images are resized to
+    each of the sizes, and a fixed set of query descriptors is matched
+    against them with every matcher which supports the type. The time is the
+    fastest of repeat runs, including building any index, and the memory is
+    the peak RSS growth of one run in a child process.
+    """
+    columns = ['descriptor', 'matcher', 'size', 'queries', 'bytes', 'time', 'rate', 'memory']
+
+    if matchers is None:
+        matchers = [Matcher(strategy) for strategy in Matcher.strategies]
+    if store is None:
+        store = ImageStore()
+    images = store.images(files)
+
+    results = ResultsWriter(os.path.join('results', 'matchscaling.csv'), columns,
+                            ['descriptor', 'matcher', 'size'], resume=resume)
+    with results:
+        for descriptor, des in extract_descriptors(images, detector).items():
+            print("Running test {} ({} descriptors)".format(descriptor, len(des)))
+            rng = np.random.default_rng(seed)
+            query = des[rng.choice(len(des), min(queries, len(des)), replace=False)]
+
+            for size in sizes:
+                train = resize_descriptors(des, size, rng)
+
+                for matcher in matchers:
+                    if not matcher.supports(des.dtype) or results.done(descriptor, matcher.name, size):
+                        continue
+
+                    _, times = time_call(matcher.match, query, train, repeat=repeat)
+                    time = times.min()
+                    peak = peak_memory(_count_matches, matcher, query, train)[1] if memory else np.nan
+
+                    results.append([descriptor, matcher.name, size, len(query), des[0].nbytes, time,
+                                    len(query) / time * 1000, peak])  # ms -> s
+
+    return results.read()
+
+
+def generate_heatmap(data, measure='rate'):
+    """
+    Generate heatmap of a measure against the number of train descriptors.
+
+    measure is 'rate' for matches per second, or 'memory' for peak memory.
+    """
+    fig, ax = plt.subplots(figsize=(10, 8))
+
+    if measure == 'rate':
+        df = data.pivot_table('rate', ['descriptor', 'matcher'], 'size') / 1000
+        label = 'Matches per second / thousands'
+        cmap = 'viridis'
+    elif measure == 'memory':
+        df = data.pivot_table('memory', ['descriptor', 'matcher'], 'size') / 2**20  # B -> MiB
+        label = 'Peak memory / MiB'
+        cmap = 'viridis_r'
+    else:
+        raise ValueError("Unsupported measure")
+
+    sns.heatmap(df, vmin=0, cmap=cmap, annot=True, fmt=".0f", ax=ax,
+                linewidths=1, cbar_kws={'label': label})
+    ax.set_title("Matching throughput test")
+    ax.set_xlabel("Number of train descriptors")
+    plt.tight_layout()
+
+    path = os.path.join("results", "matchscaling-{}.pdf".format(measure))
+    ensure_path(path)
+    fig.savefig(path)
+    return fig
@@ -0,0 +1,108 @@
+import os
+import pickle
+import resource
+import tracemalloc
+
+
+def _status(field):
+    """Read a memory field of /proc/self/status, in bytes."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024  # kB -> B
+    raise KeyError(field)
+
+
+def _reset_peak():
+    """Reset the peak RSS to the current RSS, if the kernel allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def _measure(func, args):
+    try:
+        if _reset_peak():
+            baseline = _status('VmRSS')
+            result = func(*args)
+            peak = _status('VmHWM') - baseline
+        else:
+            # ru_maxrss is in kB on Linux, and only grows if the peak is passed
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result = func(*args)
+            peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) * 1024
+        return result, max(peak, 0), None
+    except Exception as e:
+        return None, 0, e
+
+
+def peak_memory(func, *args):
+    """
+    Measure the peak memory a function call needs.
+
+    The call is made in a forked child process, so that memory held by the
+    parent, or freed by an earlier call, doesn't hide the call's own peak.
+    The child is forked directly, so this also works in the daemonic
+    workers of a multiprocessing.Pool.
+
+    Parameters
+    ----------
+    func: callable
+        The function to call. Its return value must be picklable.
+    args
+        The arguments to call it with.
+
+    Returns
+    -------
+    result
+        The return value of the call.
+    int
+        The growth of the child's resident set size at its peak, in bytes.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            with os.fdopen(write, 'wb') as f:
+                try:
+                    pickle.dump(_measure(func, args), f)
+                except Exception as e:
+                    pickle.dump((None, 0, RuntimeError(repr(e))), f)
+        finally:
+            os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read, 'rb') as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+
+    if not data:
+        raise RuntimeError("Memory measurement process died")
+    result, peak, error = pickle.loads(data)
+    if error is not None:
+        raise error
+    return result, peak
+
+
+def python_peak(func, *args):
+    """
+    Measure the peak of the Python allocations during a function call.
+
+    Returns
+    -------
+    result
+        The return value of the call.
+    int
+        The peak size of the memory traced by tracemalloc, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak
@@ -1,65 +1,128 @@
+import inspect
 import os
 
-import cv2
 from matplotlib import ticker
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from scipy import linalg
-from scipy.spatial import distance
+from scipy.spatial import cKDTree
 
 from .detectordescriptor import DetectorDescriptor
-from .utils import create_mask, ensure_path, h_for_file, point_in_mask, transform_point
-
-
-def run_test(files, full=False, threshold=2):
-    """Run the repeatability test"""
-    columns = ['detector', 'image', 'common', 'repeat']
-    data = []
-
-    if full:
-        det_s = {**DetectorDescriptor.detectors, **DetectorDescriptor.xdetectors}.keys()
+from .geometry import image_number, sequence_geometry
+from .imagestore import ImageStore
+from .keypoints import points
+from .results import ResultsWriter
+from .utils import ensure_path, transform_points
+
+
+def count_repeated(tree, valid, pts, threshold):
+    """
+    Count the points which have a valid base point closer than the threshold.
+
+    Parameters
+    ----------
+    tree: cKDTree
+        Index of all of the base image's points.
+    valid: np.ndarray
+        Booleans saying which of the indexed points may be matched.
+    pts: np.ndarray
+        The (N, 2) points to look up.
+    threshold: float
+        The distance a base point must be within.
+
+    Returns
+    -------
+    int
+        The number of repeated points.
+    """
+    if tree.n == 0 or len(pts) == 0:
+        return 0
+
+    dists, idx = tree.query(pts, distance_upper_bound=threshold)
+    found = np.isfinite(dists)
+    repeated = np.count_nonzero(valid[idx[found]])
+
+    # When the nearest point is outside the common area, another one may still be close enough
+    retry = np.flatnonzero(found)[~valid[idx[found]]]
+    for p, near in zip(pts[retry], tree.query_ball_point(pts[retry], threshold)):
+        near = np.asarray(near, int)
+        near = near[valid[near]]
+        if np.any(np.hypot(*(tree.data[near] - p).T) < threshold):
+            repeated += 1
+
+    return repeated
+
+
+def run_test(files, full=False, threshold=2, cache=None, store=None, resume=False, tiles=None,
+             **tiling):
+    """
+    Run the repeatability test
+
+    Images are read through an ImageStore, and keypoints can be reused from
+    a FeatureCache. Rows are written to results/repeatability.csv as they
+    finish. With resume, the images already in that file are skipped.
+
+    With tiles, e.g. (2, 2), keypoints are detected with detect_tiled(),
+    which also takes any other keyword arguments. The rows are written to a
+    file named after every tiling setting instead, with the defaults filled
+    in, e.g. results/repeatability-2x2-overlap=32-max_keypoints=None-threads=None.csv,
+    so that resuming never mixes rows from different settings.
+    """
+    columns = ['detector', 'sequence', 'image', 'common', 'repeat']
+
+    det_s = DetectorDescriptor.detector_names(full)
+
+    if store is None:
+        store = ImageStore()
+
+    if tiles is None:
+        name = 'repeatability.csv'
     else:
-        det_s = DetectorDescriptor.detectors.keys()
-
-    for detector in det_s:
-        algo = DetectorDescriptor(detector)
-        print("Running test {}".format(detector))
-
-        for f in files:
-            filename = os.path.basename(f).split('.')[0]
-            image = cv2.imread(f, 0)
-            kps = algo.detect(image)
-
-            h = h_for_file(f)
-            if h is None:  # This will be the case for the base image (img1)
-                baseimg = image
-                basepts = kps
-
-                data.append([detector, filename, len(basepts), len(basepts)])
-                continue
-
-            hi = linalg.inv(h)
-            mask = create_mask(baseimg.shape, hi)
-
-            # Only those that are common
-            bpts = []
-            for pt in basepts:
-                if point_in_mask(pt.pt, mask):
-                    bpts.append(pt)
-            bptst = np.vstack([pt.pt for pt in bpts])
-
-            rep = 0
-            for point in kps:
-                tp = transform_point(point.pt, hi)
-                if point_in_mask(tp, mask):
-                    dists = distance.cdist([tp], bptst)
-                    if np.min(dists) < threshold:
-                        rep += 1
-
-            data.append([detector, filename, len(bpts), rep])
-
-    df = pd.DataFrame(data, columns=columns)
+        params = inspect.signature(DetectorDescriptor.detect_tiled).parameters
+        settings = {key: tiling.get(key, param.default) for key, param in params.items()
+                    if key not in ('self', 'image', 'tiles')}
+        name = 'repeatability-{}x{}{}.csv'.format(
+            *tiles, ''.join('-{}={}'.format(key, value) for key, value in settings.items()))
+    results = ResultsWriter(os.path.join('results', name), columns,
+                            ['detector', 'sequence', 'image'], resume=resume)
+    with results:
+        for detector in det_s:
+            algo = DetectorDescriptor(detector, cache=cache)
+            print("Running test {}".format(detector))
+
+            for f in files:
+                sequence = os.path.basename(os.path.dirname(os.path.abspath(f)))
+                filename = os.path.basename(f).split('.')[0]
+                n = image_number(f)
+
+                # The base image is always needed by the rest of its sequence
+                if n != 1 and results.done(detector, sequence, filename):
+                    continue
+
+                image = store.image(f)
+                if tiles is None:
+                    kps = algo.detect(image)
+                else:
+                    kps = algo.detect_tiled(image, tiles, **tiling)
+
+                if n == 1:  # The base image
+                    geometry = sequence_geometry(os.path.abspath(os.path.dirname(f)), image.shape[:2])
+                    basepts = points(kps)
+                    basetree = cKDTree(basepts)
+
+                    if not results.done(detector, sequence, filename):
+                        results.append([detector, sequence, filename, len(basepts), len(basepts)])
+                    continue
+
+                # Only those that are common
+                common = geometry.common(basepts, n)
+
+                tps = transform_points(points(kps), geometry.hi[n])
+                tps = tps[geometry.common(tps, n)]
+                rep = count_repeated(basetree, common, tps, threshold)
+
+                results.append([detector, sequence, filename, np.count_nonzero(common), rep])
+
+    df = results.read()
     df['repeatability'] = df['repeat'] / df['common']
     return df
 
@@ -0,0 +1,160 @@
+import itertools
+import os
+
+import cv2
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .benchmark import time_call
+from .detectordescriptor import DetectorDescriptor
+from .geometry import image_number, scaled_shape, sequence_geometry
+from .imagestore import ImageStore
+from .keypoints import points
+from .repeatability import count_repeated
+from .results import ResultsWriter
+from .utils import ensure_path, transform_points
+
+
+def scale_image(image, factor):
+    """Resize an image by a factor, to the shape given by scaled_shape()."""
+    rows, cols = scaled_shape(image.shape, factor)
+    interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, (cols, rows), interpolation=interpolation)
+
+
+def run_test(files, factors=(0.5, 1, 2, 4), full=False, threshold=2, repeat=3, store=None,
+             resume=False):
+    """
+    Run the resolution scaling test
+
+    Every image is resized by each factor, with its sequence's homographies
+    scaled to match, and every combination of detector and descriptor is
+    timed on it. The repeatability of the keypoints is measured at each
+    factor too, with the threshold scaled by the factor, to show what the
+    extra resolution buys. Times are the median of repeat runs.
+
+    Rows are written to results/resolution.csv as they finish. With resume,
+    the images already in that file are skipped.
+    """
+    columns = ['detector', 'descriptor', 'factor', 'sequence', 'image', 'pixels', 'detect',
+               'compute', 'nkp', 'common', 'repeat']
+
+    combinations = [(detector, descriptor) for detector, descriptor in
+                    itertools.product(DetectorDescriptor.detector_names(full),
+                                      DetectorDescriptor.descriptor_names(full))
+                    if DetectorDescriptor(detector, descriptor).desc is not None]
+
+    if store is None:
+        store = ImageStore()
+
+    results = ResultsWriter(os.path.join('results', 'resolution.csv'), columns,
+                            ['detector', 'descriptor', 'factor', 'sequence', 'image'], resume=resume)
+    with results:
+        for f in files:
+            sequence = os.path.basename(os.path.dirname(os.path.abspath(f)))
+            filename = os.path.basename(f).split('.')[0]
+            n = image_number(f)
+            image = store.image(f)
+
+            if n == 1:
+                geometry = sequence_geometry(os.path.abspath(os.path.dirname(f)), image.shape[:2])
+                base = {}
+
+            for factor in factors:
+                scaled = scale_image(image, factor)
+                scaled_geometry = geometry.scaled(factor)
+                print("Running test {} at {}x{}".format(f, *scaled.shape[1::-1]))
+
+                for detector, descriptor in combinations:
+                    # The base image is always needed by the rest of its sequence
+                    done = results.done(detector, descriptor, factor, sequence, filename)
+                    if n != 1 and done:
+                        continue
+
+                    algo = DetectorDescriptor(detector, descriptor)
+                    kps, det_times = time_call(algo.detect, scaled, repeat=repeat)
+                    (kps, _), des_times = time_call(algo.compute, scaled, kps, repeat=repeat)
+                    pts = points(kps)
+
+                    if n == 1:
+                        base[detector, descriptor, factor] = pts, cKDTree(pts)
+                        common = repeat_count = len(pts)
+                    else:
+                        basepts, basetree = base[detector, descriptor, factor]
+                        valid = scaled_geometry.common(basepts, n)
+                        tps = transform_points(pts, scaled_geometry.hi[n])
+                        tps = tps[scaled_geometry.common(tps, n)]
+                        common = np.count_nonzero(valid)
+                        repeat_count = count_repeated(basetree, valid, tps, threshold * factor)
+
+                    if not done:
+                        results.append([detector, descriptor, factor, sequence, filename,
+                                        scaled.shape[0] * scaled.shape[1], np.median(det_times),
+                                        np.median(des_times), len(pts), common, repeat_count])
+
+    df = results.read()
+    df['time'] = df['detect'] + df['compute']
+    df['repeatability'] = df['repeat'] / df['common']
+    return df
+
+
+def fit_scaling(df, tolerance=0.1):
+    """
+    Fit how the time of each combination scales with resolution.
+
+    Two fits are made for each combination. A line through log time against
+    log pixels gives the exponent of the scaling, which is flagged as
+    super-linear when it is over 1 + tolerance. A least squares fit of
+    time = a + b * pixels + c * keypoints splits the cost into its parts.
+
+    Returns
+    -------
+    pd.DataFrame
+        For each detector and descriptor, the exponent, the fixed cost in ms,
+        the cost per megapixel in ms, the cost per keypoint in µs, and whether
+        the scaling is super-linear.
+    """
+    rows = []
+    for (detector, descriptor), data in df.groupby(['detector', 'descriptor']):
+        pixels = data['pixels'].to_numpy(np.float64)
+        nkp = data['nkp'].to_numpy(np.float64)
+        time = data['time'].to_numpy(np.float64)
+
+        valid = time > 0
+        if len(np.unique(pixels[valid])) < 2:
+            continue
+        exponent = np.polyfit(np.log(pixels[valid]), np.log(time[valid]), 1)[0]
+
+        a = np.column_stack([np.ones_like(pixels), pixels / 1e6, nkp])
+        fixed, per_mp, per_kp = np.linalg.lstsq(a, time, rcond=None)[0]
+
+        rows.append([detector, descriptor, exponent, fixed, per_mp, per_kp * 1000,  # ms -> us
+                     exponent > 1 + tolerance])
+
+    columns = ['detector', 'descriptor', 'exponent', 'fixed', 'per_mp', 'per_kp', 'superlinear']
+    return pd.DataFrame(rows, columns=columns).set_index(['detector', 'descriptor'])
+
+
+def generate_plots(df):
+    """Plot time against megapixels for each detector, one line per descriptor."""
+    data = df.assign(mp=df['pixels'] / 1e6)
+    data = data.groupby(['detector', 'descriptor', 'mp'])['time'].mean()
+
+    for detector, times in data.groupby(level='detector'):
+        fig, ax = plt.subplots()
+
+        for (_, descriptor), line in times.groupby(level=['detector', 'descriptor']):
+            mp = line.index.get_level_values('mp')
+            ax.plot(mp, line.to_numpy(), marker='o', label=descriptor)
+
+        ax.set(xscale='log', yscale='log', xlabel="Image size / MP", ylabel="Time / ms",
+               title="Resolution scaling for {}".format(detector))
+        ax.grid(which='both')
+        ax.legend(loc='best')
+        plt.tight_layout()
+
+        path = os.path.join("results", "resolution", '{}.pdf'.format(detector))
+        ensure_path(path)
+        fig.savefig(path)
@@ -0,0 +1,100 @@
+import csv
+import os
+
+import pandas as pd
+
+from .utils import ensure_path
+
+
+class ResultsWriter:
+    """
+    Write result rows to a CSV file in batches, as they are produced.
+
+    Rows are appended every batch_size rows and when the writer is closed,
+    so an interrupted run keeps everything up to its last batch. With
+    resume, rows already in the file are kept, and done() says which units
+    of work they cover so that they can be skipped.
+
+    Use it as a context manager, so that the last batch is written even if
+    the run is interrupted.
+    """
+    def __init__(self, path, columns, key, batch_size=50, resume=False):
+        """
+        Parameters
+        ----------
+        path: str
+            The CSV file to write.
+        columns: list of str
+            The columns of each row.
+        key: list of str
+            The columns identifying a unit of work.
+        batch_size: int
+            How many rows to hold before appending them to the file.
+        resume: bool
+            Whether to keep the rows already in the file.
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.key = list(key)
+        self.batch_size = batch_size
+        self._rows = []
+        self._done = set()
+
+        ensure_path(path)
+        if resume and os.path.isfile(path) and os.path.getsize(path) > 0:
+            self._truncate_partial_row()
+            with open(path, newline='') as f:
+                header = next(csv.reader(f), [])
+            if header != self.columns:
+                raise ValueError("Can't resume {}, its columns are {} not {}".format(
+                    path, header, self.columns))
+            existing = pd.read_csv(path, usecols=self.key, dtype=str, keep_default_na=False)
+            self._done = set(existing.itertuples(index=False, name=None))
+        else:
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(self.columns)
+
+    def _truncate_partial_row(self):
+        """Remove a row which was only partly written when a run was killed."""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def _key(self, values):
+        return tuple(str(v) for v in values)
+
+    def done(self, *key):
+        """Whether a unit of work, given by its key values, is already recorded."""
+        return self._key(key) in self._done
+
+    def append(self, row):
+        """Add a row, writing the batch out if it is full."""
+        self._rows.append(row)
+        self._done.add(self._key(row[self.columns.index(k)] for k in self.key))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Append the held rows to the file."""
+        if not self._rows:
+            return
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows(self._rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self):
+        """Read every row written so far, including resumed ones."""
+        self.flush()
+        return pd.read_csv(self.path)
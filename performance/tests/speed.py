@@ -1,10 +1,12 @@
 import itertools
+import multiprocessing
+import os
 from os.path import join
 from time import perf_counter
 
+import cv2
 from matplotlib import pyplot as plt
 import numpy as np
-import pandas as pd
 import seaborn as sns
 
 # Progress updates in notebooks
@@ -14,59 +16,154 @@ except ImportError:
     pass
 
 from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .memory import peak_memory, python_peak
+from .results import ResultsWriter
 from .utils import ensure_path
 
 
-def run_test(images, full=False):
-    """Run the speed test"""
-    columns = ['detector', 'descriptor', 'time', 'nkp']
-    data = []
+def _detect_and_compute(algo, image):
+    """Detect and describe, returning the size of the descriptor array."""
+    descriptors = algo.compute(image, algo.detect(image))[1]
+    return descriptors.nbytes if isinstance(descriptors, np.ndarray) else 0
+
+
+def _memory_unit(algo, image):
+    """
+    Profile the memory of detecting and describing an image.
+
+    The peak RSS growth and the Python allocations are measured in their own
+    child processes, so that tracemalloc's overhead isn't in the RSS.
+    """
+    des_bytes, rss = peak_memory(_detect_and_compute, algo, image)
+    python = peak_memory(python_peak, _detect_and_compute, algo, image)[0][1]
+    return [rss, python, des_bytes]
+
+
+def _time_unit(detector, descriptor, algo, image, name, memory=False):
+    start = perf_counter()
+    keypoints = algo.detect(image)
+    keypoints = algo.compute(image, keypoints)[0]
+    end = perf_counter()
+
+    time = (end-start) * 1000  # s -> ms
+    row = [detector, descriptor, name, time, len(keypoints)]
+    if memory:
+        row += _memory_unit(algo, image)
+    return row
+
+
+def _init_worker(images, names, cores, memory):
+    """Set up a worker process of the parallel speed test."""
+    global _images, _names, _algos, _memory
+    _images = images
+    _names = names
+    _algos = {}
+    _memory = memory
+
+    if cores is not None:
+        os.sched_setaffinity(0, {cores.get()})
+        cv2.setNumThreads(1)
+
+
+def _run_unit(unit):
+    """Time one (detector, descriptor, image) unit in a worker process."""
+    detector, descriptor, i = unit
+
+    # Each worker has its own OpenCV objects
+    if (detector, descriptor) not in _algos:
+        _algos[detector, descriptor] = DetectorDescriptor(detector, descriptor)
+    return _time_unit(detector, descriptor, _algos[detector, descriptor], _images[i], _names[i],
+                      _memory)
+
+
+def run_test(files, full=False, processes=None, pin=False, memory=False, store=None, resume=False):
+    """
+    Run the speed test
+
+    Images are read through an ImageStore, by default a new one.
+
+    With processes set, the (detector, descriptor, image) units are shared
+    between that many worker processes. With pin, each worker is bound to
+    its own core and OpenCV's threading is disabled, so that timings are
+    comparable with one another.
+
+    With memory, each unit is also profiled after it is timed, adding three
+    columns: rss is the peak growth of the resident set in bytes, python is
+    the peak of the Python allocations in bytes, and des_bytes is the size
+    of the descriptor array. Each is measured in a forked child process, so
+    that one unit's allocations don't hide the next's. This forks twice per
+    unit, which lengthens the run, so it is off by default.
+
+    Rows are written to results/speed.csv as they finish, with the image
+    given by its path. With resume, the units already in that file are
+    skipped, even if images have been added or reordered since.
+    """
+    columns = ['detector', 'descriptor', 'image', 'time', 'nkp']
+    if memory:
+        columns += ['rss', 'python', 'des_bytes']
     count = 0
 
-    if full:
-        det_s = {**DetectorDescriptor.detectors, **DetectorDescriptor.xdetectors}.keys()
-        des_s = {**DetectorDescriptor.descriptors, **DetectorDescriptor.xdescriptors}.keys()
-    else:
-        det_s = DetectorDescriptor.detectors.keys()
-        des_s = DetectorDescriptor.descriptors.keys()
+    if store is None:
+        store = ImageStore()
+    images = store.images(files)
+    names = [os.path.normpath(f) for f in files]
+
+    det_s = DetectorDescriptor.detector_names(full)
+    des_s = DetectorDescriptor.descriptor_names(full)
 
     n_tests = len(det_s) * len(des_s)
-    for detector, descriptor in itertools.product(det_s, des_s):
-        algo = DetectorDescriptor(detector, descriptor)
-
-        #Only for notebooks
-        try:
-            clear_output()
-        except NameError:
-            pass
-
-        print(f"Progress: {count} / {n_tests}")
-        count += 1
-        
-        if algo.desc is None:
-            continue
-
-        for image in images:
-            start = perf_counter()
-            keypoints = algo.detect(image)
-            keypoints = algo.compute(image, keypoints)[0]
-            end = perf_counter()
-
-            time = (end-start) * 1000  # s -> ms
-            nkps = len(keypoints)
-            data.append([detector, descriptor, time, nkps])
+
+    results = ResultsWriter(join('results', 'speed.csv'), columns,
+                            ['detector', 'descriptor', 'image'], resume=resume)
+    with results:
+        if processes:
+            combinations = [(detector, descriptor) for detector, descriptor in itertools.product(det_s, des_s)
+                            if DetectorDescriptor(detector, descriptor).desc is not None]
+            units = [(detector, descriptor, i) for detector, descriptor in combinations
+                     for i, name in enumerate(names) if not results.done(detector, descriptor, name)]
+
+            if pin:
+                cores = multiprocessing.Queue()
+                available = sorted(os.sched_getaffinity(0))
+                processes = min(processes, len(available))
+                for core in available[:processes]:
+                    cores.put(core)
+            else:
+                cores = None
+
+            print(f"Running {len(units)} units on {processes} processes")
+            with multiprocessing.Pool(processes, _init_worker, (images, names, cores, memory)) as pool:
+                for row in pool.imap(_run_unit, units, chunksize=max(1, len(images) // 4)):
+                    results.append(row)
+        else:
+            for detector, descriptor in itertools.product(det_s, des_s):
+                algo = DetectorDescriptor(detector, descriptor)
+
+                #Only for notebooks
+                try:
+                    clear_output()
+                except NameError:
+                    pass
+
+                print(f"Progress: {count} / {n_tests}")
+                count += 1
+
+                if algo.desc is None:
+                    continue
+
+                for image, name in zip(images, names):
+                    if not results.done(detector, descriptor, name):
+                        results.append(_time_unit(detector, descriptor, algo, image, name, memory))
 
     print("\nDone!")
 
-    df = pd.DataFrame(data, columns=columns)
-    df.to_csv(join('results', 'speed.csv'))
-    return df
+    return results.read()
 
 
 def generate_plots(data):
     """ Generate single detector plots, and save to PDF."""
-    detectors = {**DetectorDescriptor.detectors, **DetectorDescriptor.xdetectors}.keys()
-    for detector in detectors:
+    for detector in DetectorDescriptor.detector_names(full=True):
         df = data[data.detector == detector]
 
         fig, ax = plt.subplots()
@@ -86,8 +183,17 @@ def generate_plots(data):
 
 
 def generate_heatmap(data):
-    """Generate heatmap with all combinations of detector and descriptor."""
-    fig, ax = plt.subplots(figsize=(8, 6))
+    """
+    Generate heatmap with all combinations of detector and descriptor.
+
+    If the data has memory profiles, a heatmap of the mean peak RSS growth
+    is drawn next to the time heatmap.
+    """
+    memory = 'rss' in data and data['rss'].notna().any()
+    if memory:
+        fig, (ax, mem_ax) = plt.subplots(1, 2, figsize=(16, 6))
+    else:
+        fig, ax = plt.subplots(figsize=(8, 6))
 
     df = data.pivot_table(['nkp', 'time'], ['detector', 'descriptor'], aggfunc=np.sum)
     df = ((df.time / df.nkp) * 1000).unstack()  # ms -> us
@@ -97,6 +203,15 @@ def generate_heatmap(data):
                 linewidths=1, cbar_kws={'label': 'Average CPU time per keypoint / µs'})
     ax.set_title("Speed test")
     ax.minorticks_on()
+
+    if memory:
+        df = data.pivot_table('rss', 'detector', 'descriptor', aggfunc=np.mean) / 2**20  # B -> MiB
+
+        sns.heatmap(df, vmin=0, cmap='viridis_r', annot=True, fmt=".1f", ax=mem_ax,
+                    linewidths=1, cbar_kws={'label': 'Average peak memory / MiB'})
+        mem_ax.set_title("Memory")
+        mem_ax.minorticks_on()
+
     plt.tight_layout()
 
     path = join("results", "speed.pdf")
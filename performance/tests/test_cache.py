@@ -0,0 +1,33 @@
+import os
+
+import cv2
+import numpy as np
+
+from .cache import FeatureCache
+
+
+def test_overwrite_keeps_size(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    keypoints = [cv2.KeyPoint(float(i), float(i), 7) for i in range(50)]
+    descriptors = np.arange(50 * 32, dtype=np.uint8).reshape(50, 32)
+
+    for _ in range(3):
+        cache.save('entry', keypoints, descriptors)
+    assert cache._size == sum(e.stat().st_size for e in cache._entries())
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    keypoints = [cv2.KeyPoint(float(i), float(i), 7) for i in range(50)]
+    cache.save('old', keypoints)
+    size = cache._size
+    cache.max_size = 2 * size
+
+    cache.save('new', keypoints)
+    cache.save('new', keypoints)  # Overwriting doesn't grow the cache
+    assert sorted(e.name for e in cache._entries()) == ['new.npz', 'old.npz']
+
+    # Older than the rest, so it goes first
+    os.utime(tmp_path / 'old.npz', (0, 0))
+    cache.save('newer', keypoints)
+    assert sorted(e.name for e in cache._entries()) == ['new.npz', 'newer.npz']
@@ -0,0 +1,44 @@
+import os
+
+import cv2
+import numpy as np
+
+from . import imagestore
+from .imagestore import ImageStore
+
+
+def _write_sequence(directory, seed):
+    directory.mkdir(parents=True)
+    rng = np.random.default_rng(seed)
+    images = [rng.integers(0, 256, (20, 30), np.uint8) for _ in range(3)]
+    for i, image in enumerate(images, 1):
+        cv2.imwrite(str(directory / 'img{}.pgm'.format(i)), image)
+    return images
+
+
+def test_same_names_dont_collide(tmp_path):
+    first = _write_sequence(tmp_path / 'a' / 'bark', 0)
+    second = _write_sequence(tmp_path / 'b' / 'bark', 1)
+
+    store = ImageStore(str(tmp_path / 'store'))
+    for images, directory in ((first, 'a'), (second, 'b'), (first, 'a')):
+        views = store.sequence(str(tmp_path / directory / 'bark'))
+        for view, image in zip(views, images):
+            np.testing.assert_array_equal(view, image)
+
+    # A new store finds both indices again
+    store = ImageStore(str(tmp_path / 'store'))
+    np.testing.assert_array_equal(store.image(str(tmp_path / 'b' / 'bark' / 'img2.pgm')), second[1])
+    assert not [f for f in os.listdir(tmp_path / 'store') if f.endswith('.tmp')]
+
+
+def test_lists_each_directory_once(tmp_path, monkeypatch):
+    _write_sequence(tmp_path / 'bark', 0)
+    store = ImageStore(str(tmp_path / 'store'))
+
+    calls = []
+    listdir = os.listdir
+    monkeypatch.setattr(imagestore.os, 'listdir', lambda path: calls.append(path) or listdir(path))
+    for i in (1, 2, 3, 1):
+        store.image(str(tmp_path / 'bark' / 'img{}.pgm'.format(i)))
+    assert len(calls) == 1
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+
+from .keypoints import empty, from_cv, in_rect, points, sort_by_response, strongest, to_cv
+
+
+def _keypoints():
+    return [cv2.KeyPoint(1.5, 2.5, 7, 30, 0.2, 1, 4), cv2.KeyPoint(10, 20, 5, -1, 0.9, 0, -1),
+            cv2.KeyPoint(3, 4, 9, 90, 0.2, 2, 0), cv2.KeyPoint(8, 1, 3, 45, 0.5, 0, 2)]
+
+
+def test_round_trip():
+    kps = _keypoints()
+    array = from_cv(kps)
+    assert [(k.pt, k.size, k.angle, k.response, k.octave, k.class_id) for k in to_cv(array)] == \
+           [(k.pt, k.size, k.angle, k.response, k.octave, k.class_id) for k in kps]
+
+
+def test_from_cv_fields():
+    array = from_cv(_keypoints(), ('size',))
+    np.testing.assert_array_equal(array['size'], [7, 5, 9, 3])
+    np.testing.assert_array_equal(array['response'], 0)
+    np.testing.assert_array_equal(points(array), [(1.5, 2.5), (10, 20), (3, 4), (8, 1)])
+
+
+def test_points_of_list():
+    np.testing.assert_array_equal(points(_keypoints()), points(from_cv(_keypoints())))
+    assert points([]).shape == (0, 2)
+    assert points(empty()).shape == (0, 2)
+
+
+def test_sort_and_filter():
+    array = from_cv(_keypoints())
+    np.testing.assert_array_equal(sort_by_response(array)['x'], [10, 8, 1.5, 3])
+    np.testing.assert_array_equal(strongest(array, 2)['x'], [10, 8])
+    np.testing.assert_array_equal(strongest(array, 3)['x'], [1.5, 10, 8])  # The earlier tie
+    np.testing.assert_array_equal(in_rect(array, 0, 0, 9, 5), [True, False, True, True])
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from .utils import (overlap_error, point_in_mask, points_in_mask, precision_recall_curve,
+                    transform_point, transform_points)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def homography(rng):
+    h = np.eye(3) + rng.normal(scale=[[0.1, 0.1, 5], [0.1, 0.1, 5], [1e-4, 1e-4, 0]])
+    return h / h[2, 2]
+
+
+def test_transform_points_matches_scalar(rng, homography):
+    pts = rng.uniform(-100, 700, (200, 2))
+    pts[:10] *= -1
+    pts[10] = np.nan
+
+    expected = np.array([transform_point(tuple(p), homography) for p in pts])
+    np.testing.assert_allclose(transform_points(pts, homography), expected, equal_nan=True)
+
+
+def test_points_in_mask_matches_scalar(rng):
+    mask = np.where(rng.random((40, 60)) < 0.5, 255, 0).astype(np.uint8)
+    pts = rng.uniform(-20, 80, (1000, 2))
+    pts[:20] = np.round(pts[:20])  # On pixel centres, including the edges
+    pts[20, 0] = np.nan
+    pts[21, 1] = np.nan
+    pts[22] = [-0.4, -0.4]  # Rounds to the first pixel
+
+    with np.errstate(invalid='ignore'):
+        expected = np.array([point_in_mask(p, mask) for p in pts])
+    np.testing.assert_array_equal(points_in_mask(pts, mask), expected)
+
+
+def test_points_in_mask_axes():
+    # Masks are indexed mask[y, x]
+    mask = np.zeros((40, 60), np.uint8)
+    mask[5, 30] = 255
+
+    pts = [(30, 5), (5, 30), (30, 50), (59, 39), (60, 5)]
+    np.testing.assert_array_equal(points_in_mask(pts, mask), [True, False, False, False, False])
+    assert [point_in_mask(p, mask) for p in pts] == [True, False, False, False, False]
+
+
+def test_overlap_error_matches_raster(rng):
+    h = np.array([[1.05, 0.02, 3], [-0.01, 0.97, -2], [1e-5, 2e-5, 1]])
+    pts1 = rng.uniform(60, 140, (30, 2))
+    sizes1 = rng.uniform(30, 60, 30)
+    pts2 = transform_points(pts1 + rng.normal(0, 4, (30, 2)), np.linalg.inv(h))
+    sizes2 = sizes1 * rng.uniform(0.8, 1.25, 30)
+
+    analytic = overlap_error(pts1, sizes1, pts2, sizes2, h, samples=40)
+    raster = overlap_error(pts1, sizes1, pts2, sizes2, h, (200, 200), method='raster')
+    np.testing.assert_allclose(analytic, raster, atol=0.07)
+    assert np.mean(np.abs(analytic - raster)) < 0.03
+
+
+def test_overlap_error_limits():
+    pts = [(50, 50), (50, 50), (50, 50)]
+    error = overlap_error(pts, [20, 20, 20], [(50, 50), (150, 50), (50, 50)], [20, 20, 0], np.eye(3))
+    np.testing.assert_allclose(error, [0, 1, 1], atol=1e-9)
+
+
+def test_precision_recall_curve_matches_thresholds(rng):
+    distances = rng.integers(0, 50, 300).astype(np.float64)  # With ties
+    correct = rng.random(300) < np.exp(-distances / 20)
+
+    thresholds, precision, recall = precision_recall_curve(distances, correct)
+    np.testing.assert_array_equal(thresholds, np.unique(distances))
+
+    for t, p, r in zip(thresholds, precision, recall):
+        accepted = distances <= t
+        assert p == pytest.approx(np.count_nonzero(accepted & ~correct) / np.count_nonzero(accepted))
+        assert r == pytest.approx(np.count_nonzero(accepted & correct) / np.count_nonzero(correct))
+
+
+def test_precision_recall_curve_empty():
+    thresholds, precision, recall = precision_recall_curve([], [])
+    assert len(thresholds) == len(precision) == len(recall) == 0
@@ -0,0 +1,145 @@
+import itertools
+import os
+
+from matplotlib import pyplot as plt
+import numpy as np
+
+from .benchmark import opencv_settings, opencv_state, time_call
+from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .results import ResultsWriter
+from .utils import ensure_path
+
+
+def _units(full):
+    """
+    The (stage, detector, descriptor, algo) units of the sweep.
+
+    The descriptor of a detect unit is empty.
+    """
+    det_s = DetectorDescriptor.detector_names(full)
+    des_s = DetectorDescriptor.descriptor_names(full)
+
+    units = []
+    # Combined, for the algorithms which are both a detector and a descriptor
+    for name in det_s:
+        if name in des_s:
+            units.append(('combined', name, name, DetectorDescriptor(name, name)))
+
+    # Detection doesn't depend on the descriptor, so it is timed once per detector
+    for detector in det_s:
+        units.append(('detect', detector, '', DetectorDescriptor(detector)))
+
+    for detector, descriptor in itertools.product(det_s, des_s):
+        algo = DetectorDescriptor(detector, descriptor)
+        if algo.desc is not None:
+            units.append(('compute', detector, descriptor, algo))
+    return units
+
+
+def _time_stage(stage, algo, images, repeat):
+    """Sum of the median time of a stage on each image, and the number of keypoints."""
+    time = 0
+    nkp = 0
+    for image in images:
+        if stage == 'combined':
+            (kps, _), times = time_call(algo.detect_and_compute, image, repeat=repeat)
+        elif stage == 'detect':
+            kps, times = time_call(algo.detect, image, repeat=repeat)
+        else:
+            (kps, _), times = time_call(algo.compute, image, algo.detect(image), repeat=repeat)
+        time += np.median(times)
+        nkp += len(kps)
+    return time, nkp
+
+
+def run_test(files, threads=None, optimized=(True, False), full=False, repeat=3, store=None,
+             resume=False):
+    """
+    Run the thread count and optimisation sweep
+
+    Images are read through an ImageStore, by default a new one. The
+    combined detect and compute, and the separate detect and compute stages,
+    of every algorithm are timed with OpenCV limited to each number of
+    threads (1 to the number of CPUs by default), with its SIMD
+    optimisations on and off. OpenCL is off throughout.
+
+    Rows are written to results/threadsweep.csv as they finish. With resume,
+    the settings already in that file are skipped.
+    """
+    columns = ['stage', 'detector', 'descriptor', 'threads', 'optimized', 'time', 'nkp', 'cpu']
+
+    if threads is None:
+        threads = range(1, os.cpu_count() + 1)
+    if store is None:
+        store = ImageStore()
+    images = store.images(files)
+    units = _units(full)
+
+    results = ResultsWriter(os.path.join('results', 'threadsweep.csv'), columns,
+                            ['stage', 'detector', 'descriptor', 'threads', 'optimized'], resume=resume)
+    with results:
+        for n, opt in itertools.product(threads, optimized):
+            print("Running test with {} threads, optimisations {}".format(n, 'on' if opt else 'off'))
+
+            with opencv_settings(n, opt, opencl=False):
+                cpu = opencv_state()['cpu']
+                for stage, detector, descriptor, algo in units:
+                    if results.done(stage, detector, descriptor, n, opt):
+                        continue
+
+                    time, nkp = _time_stage(stage, algo, images, repeat)
+                    results.append([stage, detector, descriptor, n, opt, time, nkp, cpu])
+
+    return scaling(results.read())
+
+
+def scaling(df):
+    """
+    Add the speed-ups to the results of the sweep.
+
+    speedup is the time with 1 thread over the time with this many, and
+    efficiency is the speed-up per thread, both with the same optimisation
+    setting. simd is the time without optimisations over the time with
+    them, with the same number of threads.
+    """
+    algo = ['stage', 'detector', 'descriptor']
+
+    single = df[df['threads'] == 1].set_index(algo + ['optimized'])['time']
+    base = single.reindex(df.set_index(algo + ['optimized']).index).to_numpy()
+    df['speedup'] = base / df['time']
+    df['efficiency'] = df['speedup'] / df['threads']
+
+    plain = df[~df['optimized']].set_index(algo + ['threads'])['time']
+    base = plain.reindex(df.set_index(algo + ['threads']).index).to_numpy()
+    df['simd'] = base / df['time']
+    return df
+
+
+def generate_plots(df, optimized=True):
+    """Plot the speed-up against the number of threads for each stage."""
+    data = df[df['optimized'] == optimized]
+
+    for stage, stage_data in data.groupby('stage'):
+        fig, ax = plt.subplots(figsize=(8, 6))
+
+        if stage == 'compute':
+            algo = stage_data['detector'] + ' + ' + stage_data['descriptor']
+        else:
+            # Neither depends on the descriptor it is paired with
+            algo = stage_data['detector']
+        lines = stage_data.assign(algo=algo).groupby(['algo', 'threads'])['speedup'].mean()
+
+        for name, line in lines.groupby(level='algo'):
+            ax.plot(line.index.get_level_values('threads'), line.to_numpy(), marker='o', label=name)
+
+        most = data['threads'].max()
+        ax.plot([1, most], [1, most], 'k:', label='Ideal')
+        ax.set(xlabel="Threads", ylabel="Speed-up", title="Thread scaling of {}".format(stage))
+        ax.grid(which='major')
+        ax.legend(loc='best', fontsize='small', ncol=2)
+        plt.tight_layout()
+
+        path = os.path.join("results", "threadsweep", '{}.pdf'.format(stage))
+        ensure_path(path)
+        fig.savefig(path)
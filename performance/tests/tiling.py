@@ -0,0 +1,89 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from . import repeatability
+from .benchmark import time_call
+from .detectordescriptor import DetectorDescriptor
+from .imagestore import ImageStore
+from .results import ResultsWriter
+from .utils import ensure_path
+
+
+def run_test(files, tiles=(2, 2), overlap=32, threads=None, full=False, repeat=3, store=None,
+             resume=False):
+    """
+    Compare tiled detection with detection on the whole image
+
+    Each detector is timed on every image both ways, with the median of
+    repeat runs written to results/tiling.csv. The repeatability test is then
+    run both ways, on the same images.
+
+    Returns
+    -------
+    pd.DataFrame
+        For each detector, the mean time and number of keypoints both ways,
+        the speedup of tiling, and the mean repeatability both ways.
+    """
+    columns = ['detector', 'mode', 'sequence', 'image', 'time', 'nkp']
+
+    if store is None:
+        store = ImageStore()
+    tiling = dict(overlap=overlap, threads=threads)
+    mode = '{}x{}'.format(*tiles)
+
+    results = ResultsWriter(os.path.join('results', 'tiling.csv'), columns,
+                            ['detector', 'mode', 'sequence', 'image'], resume=resume)
+    with results:
+        for detector in DetectorDescriptor.detector_names(full):
+            algo = DetectorDescriptor(detector)
+            print("Running test {}".format(detector))
+
+            for f in files:
+                sequence = os.path.basename(os.path.dirname(os.path.abspath(f)))
+                filename = os.path.basename(f).split('.')[0]
+                image = store.image(f)
+
+                if not results.done(detector, 'whole', sequence, filename):
+                    kps, times = time_call(algo.detect, image, repeat=repeat)
+                    results.append([detector, 'whole', sequence, filename, np.median(times), len(kps)])
+
+                if not results.done(detector, mode, sequence, filename):
+                    kps, times = time_call(lambda i: algo.detect_tiled(i, tiles, **tiling), image,
+                                           repeat=repeat)
+                    results.append([detector, mode, sequence, filename, np.median(times), len(kps)])
+
+    speed = results.read()
+    speed = speed[speed['mode'].isin(['whole', mode])]
+    speed = speed.pivot_table(['time', 'nkp'], 'detector', 'mode')
+
+    whole = repeatability.run_test(files, full, store=store, resume=resume)
+    tiled = repeatability.run_test(files, full, store=store, resume=resume, tiles=tiles, **tiling)
+
+    summary = speed['time'].add_prefix('time_').join(speed['nkp'].add_prefix('nkp_'))
+    summary['speedup'] = summary['time_whole'] / summary['time_' + mode]
+    summary['repeatability_whole'] = whole.groupby('detector')['repeatability'].mean()
+    summary['repeatability_' + mode] = tiled.groupby('detector')['repeatability'].mean()
+    return summary
+
+
+def generate_plots(summary):
+    """Plot the speedup and the change in repeatability from tiling."""
+    mode = next(c for c in summary.columns if c.startswith('time_') and c != 'time_whole')[5:]
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 4))
+
+    summary['speedup'].plot.bar(ax=ax1)
+    ax1.axhline(1, color='k', linewidth=1)
+    ax1.set(ylabel="Speedup", title="Speed of {} tiles".format(mode))
+
+    summary[['repeatability_whole', 'repeatability_' + mode]].plot.bar(ax=ax2)
+    ax2.legend(['Whole image', '{} tiles'.format(mode)], loc='best')
+    ax2.set(ylabel="Mean repeatability", title="Repeatability")
+    plt.tight_layout()
+
+    path = os.path.join("results", "tiling.pdf")
+    ensure_path(path)
+    fig.savefig(path)
+    return fig
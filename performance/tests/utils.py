@@ -35,6 +35,50 @@ def transform_point(p, h):
     return tuple((d / d[2])[:2].reshape(1, -1)[0])
 
 
+def transform_points(pts, h):
+    """
+    Transform an array of points using a homography matrix.
+
+    Parameters
+    ----------
+    pts: array_like
+        The (N, 2) points to transform.
+    h: array_like
+        The homography matrix.
+
+    Returns
+    -------
+    np.ndarray
+        The (N, 2) new locations of the points.
+    """
+    pts = np.asarray(pts, np.float64).reshape(-1, 2)
+    d = np.column_stack((pts, np.ones(len(pts)))) @ np.transpose(h)
+    return d[:, :2] / d[:, 2:]
+
+
+def homography_jacobians(pts, h):
+    """
+    The Jacobian of a homography at each of an array of points.
+
+    Parameters
+    ----------
+    pts: array_like
+        The (N, 2) points.
+    h: array_like
+        The homography matrix.
+
+    Returns
+    -------
+    np.ndarray
+        The (N, 2, 2) Jacobians, the local affine approximations of h.
+    """
+    pts = np.asarray(pts, np.float64).reshape(-1, 2)
+    h = np.asarray(h, np.float64)
+    c = transform_points(pts, h)
+    w = np.column_stack((pts, np.ones(len(pts)))) @ h[2]
+    return (h[None, :2, :2] - c[:, :, None] * h[None, 2, :2][:, None, :]) / w[:, None, None]
+
+
 def point_in_mask(p, mask):
     """
     Test if a point is in an area created by create_mask().
@@ -42,7 +86,7 @@ def point_in_mask(p, mask):
     Parameters
     ----------
     p: array_like
-        A point.
+        A point, as (x, y).
     mask: np.ndarray
         A mask created with create_mask().
 
@@ -58,11 +102,226 @@ def point_in_mask(p, mask):
         return False
 
     try:
-        return mask.item(x, y) != 0
+        return mask.item(y, x) != 0
     except IndexError:
         return False
 
 
+def points_in_mask(pts, mask):
+    """
+    Test which points are in an area created by create_mask().
+
+    Parameters
+    ----------
+    pts: array_like
+        The (N, 2) points, as (x, y).
+    mask: np.ndarray
+        A mask created with create_mask().
+
+    Returns
+    -------
+    np.ndarray
+        The (N,) booleans saying whether each point is in the image
+        represented by the mask.
+    """
+    pts = np.asarray(pts, np.float64).reshape(-1, 2)
+    inside = np.all(np.isfinite(pts), axis=1)
+    p = np.zeros(pts.shape, int)
+    p[inside] = np.rint(pts[inside])
+    x, y = p[:, 0], p[:, 1]
+
+    inside &= (x >= 0) & (y >= 0) & (x < mask.shape[1]) & (y < mask.shape[0])
+    inside[inside] = mask[y[inside], x[inside]] != 0
+    return inside
+
+
+def _unit_disc(samples):
+    """Regular grid of sample points covering the unit disc."""
+    g = (np.arange(samples) + 0.5) / samples * 2 - 1
+    u = np.stack(np.meshgrid(g, g), axis=-1).reshape(-1, 2)
+    return u[np.einsum('ij,ij->i', u, u) <= 1]
+
+
+def _raster_overlap_error(pt1, size1, pt2, size2, h, shape):
+    img1 = np.zeros(shape, np.uint8)
+    cv2.circle(img1, (round(pt1[0]), round(pt1[1])), round(size1 / 2), 255, -1, cv2.LINE_AA)
+
+    img2 = np.zeros(shape, np.uint8)
+    cv2.circle(img2, (round(pt2[0]), round(pt2[1])), round(size2 / 2), 255, -1, cv2.LINE_AA)
+    img2 = cv2.warpPerspective(img2, h, shape[1::-1])
+
+    union = np.sum(cv2.bitwise_or(img1, img2))
+    intersection = np.sum(cv2.bitwise_and(img1, img2))
+    if union == 0:
+        return 1
+    else:
+        return 1 - (intersection / union)
+
+
+def overlap_error(pts1, sizes1, pts2, sizes2, h, shape=None, method='analytic', samples=20):
+    """
+    Calculate the overlap error between pairs of keypoint regions.
+
+    Each keypoint covers a circle of diameter ``size``. The regions from the
+    second image are mapped into the first by the homography, and the error
+    for each pair is ``1 - intersection / union``.
+
+    Parameters
+    ----------
+    pts1: array_like
+        The (N, 2) keypoint centres in the first image.
+    sizes1: array_like
+        The (N,) keypoint diameters in the first image.
+    pts2: array_like
+        The (N, 2) keypoint centres in the second image.
+    sizes2: array_like
+        The (N,) keypoint diameters in the second image.
+    h: array_like
+        The homography matrix mapping the second image onto the first.
+    shape: tuple, optional
+        The shape of the first image's ndarray, needed by the raster method.
+    method: {'analytic', 'raster'}
+        'analytic' approximates the homography around each keypoint by its
+        local affine transformation, so the mapped circle becomes an ellipse,
+        and integrates the overlap over a fixed grid for all pairs at once.
+        'raster' draws and warps both regions at full image size for every
+        pair. It is much slower and is kept as a reference.
+    samples: int
+        The grid resolution across the region diameter for 'analytic'.
+
+    Returns
+    -------
+    np.ndarray
+        The (N,) overlap errors, between 0 and 1.
+    """
+    pts1 = np.asarray(pts1, np.float64).reshape(-1, 2)
+    pts2 = np.asarray(pts2, np.float64).reshape(-1, 2)
+    r1 = np.asarray(sizes1, np.float64).reshape(-1) / 2
+    r2 = np.asarray(sizes2, np.float64).reshape(-1) / 2
+    h = np.asarray(h, np.float64)
+
+    if method == 'raster':
+        if shape is None:
+            raise ValueError("The raster method needs the image shape")
+        return np.array([_raster_overlap_error(p1, 2 * s1, p2, 2 * s2, h, shape)
+                         for p1, s1, p2, s2 in zip(pts1, r1, pts2, r2)], np.float64)
+    elif method != 'analytic':
+        raise ValueError("Unsupported overlap method")
+
+    # Centres in the first image, and the Jacobian of h at each of them
+    c2 = transform_points(pts2, h)
+    jac = homography_jacobians(pts2, h)
+    det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+
+    area1 = np.pi * r1 ** 2
+    area2 = np.pi * r2 ** 2 * np.abs(det)
+    inter = np.zeros(len(pts1))
+
+    # Integrate over whichever region is smaller, for better precision
+    u = _unit_disc(samples)
+    small1 = area1 <= area2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = np.stack((jac[:, 1, 1], -jac[:, 0, 1], -jac[:, 1, 0], jac[:, 0, 0]), axis=-1)
+        inv = inv.reshape(-1, 2, 2) / det[:, None, None]
+        step = max(1, 2 ** 20 // len(u))
+
+        idx = np.flatnonzero(small1)
+        for i in range(0, len(idx), step):
+            s = idx[i:i + step]
+            x = pts1[s, None, 0] + r1[s, None] * u[None, :, 0] - c2[s, None, 0]
+            y = pts1[s, None, 1] + r1[s, None] * u[None, :, 1] - c2[s, None, 1]
+            m = inv[s]
+            a = m[:, 0, 0, None] * x + m[:, 0, 1, None] * y
+            b = m[:, 1, 0, None] * x + m[:, 1, 1, None] * y
+            inside = a * a + b * b <= r2[s, None] ** 2
+            inter[s] = np.mean(inside, axis=1) * area1[s]
+
+        idx = np.flatnonzero(~small1)
+        for i in range(0, len(idx), step):
+            s = idx[i:i + step]
+            m = jac[s] * r2[s, None, None]
+            x = m[:, 0, 0, None] * u[None, :, 0] + m[:, 0, 1, None] * u[None, :, 1] + (c2[s, 0] - pts1[s, 0])[:, None]
+            y = m[:, 1, 0, None] * u[None, :, 0] + m[:, 1, 1, None] * u[None, :, 1] + (c2[s, 1] - pts1[s, 1])[:, None]
+            inside = x * x + y * y <= r1[s, None] ** 2
+            inter[s] = np.mean(inside, axis=1) * area2[s]
+
+        union = area1 + area2 - inter
+        error = 1 - inter / union
+
+    error[~(union > 0)] = 1
+    return error
+
+
+def precision_recall_curve(distances, correct):
+    """
+    Calculate a precision/recall curve from match distances.
+
+    A match is accepted when its distance is at or below the threshold. The
+    curve has one point for every distinct distance.
+
+    Parameters
+    ----------
+    distances: array_like
+        The (N,) descriptor distances of the matches.
+    correct: array_like
+        The (N,) booleans saying which matches are correct.
+
+    Returns
+    -------
+    thresholds: np.ndarray
+        The distinct distances, in increasing order.
+    precision: np.ndarray
+        1-precision at each threshold, i.e. the fraction of accepted matches
+        which are false.
+    recall: np.ndarray
+        The fraction of all correct matches accepted at each threshold.
+    """
+    distances = np.asarray(distances).reshape(-1)
+    correct = np.asarray(correct, bool).reshape(-1)
+    if len(distances) == 0:
+        return distances, np.empty(0), np.empty(0)
+
+    order = np.argsort(distances, kind='stable')
+    distances = distances[order]
+    tp = np.cumsum(correct[order])
+    fp = np.arange(1, len(distances) + 1) - tp
+
+    # The last match of each run of equal distances
+    last = np.flatnonzero(np.append(np.diff(distances) != 0, True))
+    tp, fp = tp[last], fp[last]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = tp / tp[-1]
+    return distances[last], fp / (tp + fp), recall
+
+
+def retain_best(keypoints, n):
+    """
+    Find the keypoints with the strongest responses.
+
+    This is cv::KeyPointsFilter::retainBest, which the Python bindings
+    don't provide, except that ties with the nth strongest response are
+    broken by keeping the earlier keypoints, so no more than n are kept.
+
+    Parameters
+    ----------
+    keypoints: list of cv2.KeyPoint
+        The keypoints.
+    n: int
+        How many keypoints to keep.
+
+    Returns
+    -------
+    np.ndarray
+        The indices of the kept keypoints, in their original order.
+    """
+    if len(keypoints) <= n:
+        return np.arange(len(keypoints))
+
+    responses = np.array([kp.response for kp in keypoints])
+    best = np.argsort(-responses, kind='stable')[:n]
+    return np.sort(best)
+
+
 def create_mask(shape, h):
     """
     Create an image mask for a transformation.
@@ -32,7 +32,7 @@ def get_files_from_argv(image=True):
 def get_cpu_name():
     try:
         info = subprocess.check_output('lscpu', shell=True).strip().decode()
-    except CalledProcessError:
+    except subprocess.CalledProcessError:
         return "Cpu name could not be determined"
     else:
         for line in info.split('\n'):
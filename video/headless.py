@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Track a target through an image sequence without a display.
+
+Run it from the top of the repository, with python -m video.headless.
+
+The target is given as a rectangle of one of the frames, a reference image,
+or a target saved by Tracking.save_target(). The homography, centre and
+stage timings of every frame are written to the output directory, and the
+sustained frame rate and latency percentiles are printed at the end.
+"""
+
+import argparse
+import os
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from performance.tests.detectordescriptor import DetectorDescriptor
+from performance.tests.matchers import Matcher
+
+from .perfcounter import RESULTS
+from .pipeline import Pipeline
+from .tracking import Tracking
+from .videocontroller import FILE_PATTERN
+
+
+def reader(pattern):
+    """A function returning each greyscale frame of a sequence in turn, then None."""
+    cap = cv2.VideoCapture(pattern)
+
+    def read():
+        ret, img = cap.read()
+        if not ret:
+            return None
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return read
+
+
+def frame_at(pattern, n):
+    read = reader(pattern)
+    for _ in range(n):
+        read()
+    frame = read()
+    if frame is None:
+        raise ValueError("The sequence has no frame {}".format(n))
+    return frame
+
+
+def run(tracking, read, pipelined=False):
+    """Track the current target through every frame, recording the timings of each."""
+    if pipelined:
+        for _ in Pipeline(tracking, read):
+            pass
+        return
+
+    perf = tracking.perf
+    while True:
+        start = perf_counter()
+        frame = read()
+        if frame is None:
+            break
+        perf.decode.append((perf_counter() - start) * 1000)
+
+        tracking.follow(frame)
+        end = perf_counter()
+        perf.latency.append((end - start) * 1000)
+        perf.finished.append(end)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pattern', nargs='?', default=FILE_PATTERN,
+                        help="the image sequence, as a printf-style pattern (default: %(default)s)")
+
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--rect', nargs=4, type=int, metavar=('X', 'Y', 'W', 'H'),
+                        help="the target's rectangle in the first frame, or the --frame one")
+    target.add_argument('--image', help="a reference image of the target")
+    target.add_argument('--target', help="a target saved by Tracking.save_target()")
+    parser.add_argument('--frame', type=int, default=0, help="the frame --rect is in")
+
+    parser.add_argument('--detector', default='Agast', choices=DetectorDescriptor.detector_names(True))
+    parser.add_argument('--descriptor', default='ORB',
+                        choices=DetectorDescriptor.descriptor_names(True))
+    parser.add_argument('--matcher', default='flann-lsh', choices=Matcher.strategies)
+    parser.add_argument('--mode', default='ratio', choices=('best', 'ratio'))
+    parser.add_argument('--ratio', type=float, default=0.8)
+
+    parser.add_argument('--roi', action='store_true',
+                        help="only search a window around the target, which --pipelined ignores "
+                             "without --flow")
+    parser.add_argument('--flow', action='store_true', help="use optical flow between keyframes")
+    parser.add_argument('--target-features', type=int,
+                        help="only keep this many of the target's strongest features")
+    parser.add_argument('--pipelined', action='store_true', help="run the stages on separate threads")
+    parser.add_argument('--output', default=RESULTS,
+                        help="the directory to write the results to (default: %(default)s)")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    # Agast's default threshold finds far more keypoints than the tracker wants
+    det_params = dict(threshold=30) if args.detector == 'Agast' else None
+    algo = DetectorDescriptor(args.detector, args.descriptor, det_params=det_params)
+    if algo.desc is None:
+        raise SystemExit("{} can't describe {} keypoints".format(args.descriptor, args.detector))
+
+    tracking = Tracking(roi=args.roi, flow=args.flow, target_features=args.target_features, algo=algo,
+                        matcher=Matcher(args.matcher, args.mode, args.ratio), report=False)
+    if args.target is not None:
+        tracking.load_target(args.target)
+    elif args.image is not None:
+        image = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise SystemExit("Can't read {}".format(args.image))
+        tracking.target = image
+    else:
+        x, y, w, h = args.rect
+        tracking.target = np.copy(frame_at(args.pattern, args.frame)[y:y+h, x:x+w])
+
+    start = perf_counter()
+    run(tracking, reader(args.pattern), args.pipelined)
+    elapsed = perf_counter() - start
+
+    perf = tracking.perf
+    if not perf.latency:
+        raise SystemExit("No frames in {}".format(args.pattern))
+
+    os.makedirs(args.output, exist_ok=True)
+    perf.save_data(args.output)
+    perf.close()
+
+    lost = np.count_nonzero(np.isnan(perf.homographies.history()[:, 0, 0]))
+    print("Tracked {} of {} frames in {:.2f} s".format(len(perf.latency) - lost, len(perf.latency),
+                                                       elapsed))
+    perf.report_pipeline()
+    print("Sustained throughput={:.1f} fps".format(len(perf.latency) / elapsed))
+    # Exact, from the whole history, rather than the streaming estimates
+    percentiles = (50, 90, 95, 99)
+    latencies = np.percentile(perf.latency.history(), percentiles)
+    print("Latency percentiles: {}".format(", ".join(
+        "{}%={:.3f} ms".format(p, latency) for p, latency in zip(percentiles, latencies))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the per-frame matching time of a tracker with a trained target index
+against one which builds an index over every frame's descriptors.
+
+Usage: python -m video.matchbench x y width height
+where the target is that rectangle of the first frame.
+"""
+
+import csv
+import sys
+from os.path import join
+
+import cv2
+import numpy as np
+
+from .perfcounter import RESULTS
+from .tracking import Tracking
+from .videocontroller import FILE_PATTERN
+
+
+def read_frames(pattern=FILE_PATTERN):
+    cap = cv2.VideoCapture(pattern)
+    frames = []
+    while True:
+        ret, img = cap.read()
+        if not ret:
+            return frames
+        frames.append(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+
+
+def run_test(frames, target, roi=False):
+    """
+    Track the target through the frames once with each kind of matching.
+
+    Returns
+    -------
+    dict
+        The match times in ms of every frame, for 'rebuilt' and 'trained'.
+    """
+    times = {}
+    for trained in (False, True):
+        tracking = Tracking(roi=roi, trained=trained)
+        tracking.target = target
+        for frame in frames:
+            tracking.find_corners(frame, target)
+        times['trained' if trained else 'rebuilt'] = tracking.perf.match.history().tolist()
+        tracking.perf.close()  # The next tracker logs to the same files
+    return times
+
+
+def save_data(times):
+    with open(join(RESULTS, 'matchbench.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(list(times))
+        writer.writerows(zip(*times.values()))
+
+
+if __name__ == '__main__':
+    x, y, w, h = (int(arg) for arg in sys.argv[1:5])
+    frames = read_frames()
+    target = np.copy(frames[0][y:y+h, x:x+w])
+
+    times = run_test(frames, target, roi='--roi' in sys.argv[5:])
+    save_data(times)
+
+    for name, match in times.items():
+        print("{}: median={:.3f} ms, mean={:.3f} ms, 95th percentile={:.3f} ms".format(
+            name, np.median(match), np.mean(match), np.percentile(match, 95)))
+    print("Speedup={:.2f}x".format(np.median(times['rebuilt']) / np.median(times['trained'])))
@@ -1,30 +1,306 @@
 import csv
-from os.path import join
+from bisect import bisect_right, insort
+from itertools import zip_longest
+import os
+from os.path import abspath, dirname, join
+import weakref
 
 import numpy as np
 
+RESULTS = join(dirname(abspath(__file__)), 'results')
+
+
+class P2Quantile:
+    """
+    Streaming estimate of a quantile, in constant memory.
+
+    This is the P² algorithm of Jain and Chlamtac (1985). Five markers track
+    the minimum, the maximum, the quantile and the quantiles half way to each
+    end, and their heights are adjusted with a piecewise parabola as values
+    arrive.
+    """
+    def __init__(self, p):
+        self.p = p
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self._heights
+        if len(q) < 5:
+            insort(q, x)
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect_right(q, x) - 1
+
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+                h = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = h
+                n[i] += s
+
+    @property
+    def value(self):
+        """The estimate, which is exact for fewer than five values."""
+        if len(self._heights) < 5:
+            return np.percentile(self._heights, self.p * 100) if self._heights else np.nan
+        return self._heights[2]
+
+
+class RingLog:
+    """
+    The latest values of a series, with its full history logged to a file.
+
+    The values are held in a fixed size ring buffer. Each time it fills, the
+    values not yet logged are appended to the file, so the memory used
+    doesn't grow with the length of the series. flush() logs them sooner.
+    """
+    def __init__(self, fname, capacity=1024, shape=(), dtype=np.float64):
+        self.fname = fname
+        self._buffer = np.empty((capacity,) + shape, dtype)
+        self._count = 0
+        self._logged = 0  # The number of values in the file
+        open(fname, 'wb').close()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        capacity = len(self._buffer)
+        self._buffer[self._count % capacity] = np.reshape(value, self._buffer.shape[1:])
+        self._count += 1
+        if self._count % capacity == 0:
+            self._flush()
+
+    def _flush(self):
+        """Called each time the buffer fills."""
+        self.flush()
+
+    def flush(self):
+        """Append the values not yet logged to the file."""
+        start = self._logged % len(self._buffer)
+        with open(self.fname, 'ab') as f:
+            self._buffer[start:start + self._count - self._logged].tofile(f)
+        self._logged = self._count
+
+    @property
+    def last(self):
+        return self._buffer[(self._count - 1) % len(self._buffer)] if self._count else np.nan
+
+    def history(self):
+        """Every value of the series, read back from the file."""
+        buffer = self._buffer
+        logged = np.fromfile(self.fname, buffer.dtype).reshape((-1,) + buffer.shape[1:])
+        start = self._logged % len(buffer)
+        return np.concatenate([logged, buffer[start:start + self._count - self._logged]])
+
+
+class Series(RingLog):
+    """
+    A series of numbers, with its statistics kept up to date as it grows.
+
+    The mean and standard deviation of the last window values are updated
+    in constant time from running sums, which are recomputed from the buffer
+    each time it is logged so that rounding errors don't build up. The
+    overall mean, the first value and estimates of the given quantiles of
+    the whole series are kept too.
+    """
+    def __init__(self, fname, window=20, quantiles=(), capacity=1024, dtype=np.float64):
+        if window > capacity:
+            raise ValueError("The window must fit in the buffer")
+        super().__init__(fname, capacity, dtype=dtype)
+        self.window = window
+        self.first = np.nan
+        self._total = 0
+        self._sum = 0
+        self._sum_sq = 0
+        self._quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def append(self, value):
+        value = float(value)
+        buffer = self._buffer
+        if self._count == 0:
+            self.first = value
+        elif self._count >= self.window:
+            old = float(buffer[(self._count - self.window) % len(buffer)])
+            self._sum -= old
+            self._sum_sq -= old * old
+
+        self._total += value
+        self._sum += value
+        self._sum_sq += value * value
+        for estimate in self._quantiles.values():
+            estimate.add(value)
+
+        super().append(value)
+
+    def _flush(self):
+        super()._flush()
+        recent = self._buffer[-self.window:].astype(np.float64)
+        self._sum = recent.sum()
+        self._sum_sq = np.dot(recent, recent)
+
+    @property
+    def mean(self):
+        return self._total / self._count if self._count else np.nan
+
+    @property
+    def rolling_mean(self):
+        n = min(self._count, self.window)
+        return self._sum / n if n else np.nan
+
+    @property
+    def rolling_std(self):
+        n = min(self._count, self.window)
+        if not n:
+            return np.nan
+        mean = self._sum / n
+        return np.sqrt(max(self._sum_sq / n - mean * mean, 0))
+
+    def quantile(self, p):
+        """
+        One of the quantiles given when the series was made.
+
+        It is exact while the whole series fits in the buffer. After that it
+        is the P² estimate, raised to those of the lower quantiles where
+        needed, as the separate estimates can cross in the tails.
+        """
+        if p not in self._quantiles:
+            raise KeyError(p)
+        if self._count <= len(self._buffer):
+            return np.percentile(self._buffer[:self._count], p * 100) if self._count else np.nan
+        return max(estimate.value for q, estimate in self._quantiles.items() if q <= p)
+
+
+def _flush(logs):
+    for log in logs:
+        log.flush()
+
+
 class PerfCounter:
-    def __init__(self):
-        self.detect = []
-        self.compute = []
-        self.match = []
-        self.nkps = []
-        self.centres = []
-
-    def report_last(self, values):
-        det = np.average(self.detect[-values:])
-        des = np.average(self.compute[-values:])
-        match = np.average(self.match[-values:])
-        nkps = np.average(self.nkps[-values:])
-        print("detection={:02.3f}, description={:02.3f}, matching={:02.3f} ms with {} keypoints".format(det, des, match, nkps))
-
-    def save_data(self):
-        with open(join('results', 'perf.csv'), 'w', newline='') as csvfile:
+    """
+    The timings and results of tracking each frame.
+
+    Only the latest capacity values of each series are kept in memory, with
+    rolling statistics over the last window frames and streaming estimates
+    of the quantiles of the times. The full history is logged to files in
+    log_dir, by default results/perflog, which are kept after the program
+    ends and overwritten by the next counter to use the same directory, so
+    counters in use at the same time need their own. save_data() writes the
+    history out as CSV files.
+
+    The values not yet logged are written by close(), or on leaving a with
+    block. A counter which isn't closed writes them when it is garbage
+    collected, or at exit.
+    """
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=20, capacity=1024, log_dir=join(RESULTS, 'perflog')):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+
+        def series(name, quantiles=(), **kwargs):
+            return Series(join(log_dir, name), window, quantiles, capacity, **kwargs)
+
+        def times(name):
+            return series(name, self.quantiles)
+
+        self.decode = times('decode')
+        self.detect = times('detect')
+        self.compute = times('compute')
+        self.match = times('match')
+        self.display = times('display')
+        self.nkps = series('nkps', dtype=np.int64)
+        self.searched = series('searched')  # The fraction of each frame searched for features
+        self.centres = RingLog(join(log_dir, 'centres'), capacity, (2,))
+        # From the target to each frame, NaN where it was lost
+        self.homographies = RingLog(join(log_dir, 'homographies'), capacity, (3, 3))
+        self.flow = times('flow')  # Following points with optical flow, including when it gave up
+        # Whether features were matched in each frame, when using optical flow
+        self.keyframe = series('keyframe', dtype=np.int64)
+
+        self.latency = times('latency')  # From decoding a frame to having displayed it
+        self.finished = series('finished')  # When each frame was displayed, from perf_counter()
+
+        # Doesn't refer to the counter, so that it can still be collected before exit
+        logs = [log for log in vars(self).values() if isinstance(log, RingLog)]
+        self._close = weakref.finalize(self, _flush, logs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Log the values still in the buffers, so that none are lost."""
+        self._close()
+
+    def report_last(self):
+        print("detection={:02.3f}, description={:02.3f}, matching={:02.3f} ms with {} keypoints".format(
+            self.detect.rolling_mean, self.compute.rolling_mean, self.match.rolling_mean,
+            self.nkps.rolling_mean))
+
+    def stage_throughput(self):
+        """The frames per second each stage could manage on its own."""
+        stages = {
+            'decode': self.decode.mean,
+            'extract': self.detect.mean + self.compute.mean,
+            'match': self.match.mean + self.flow.mean if len(self.flow) else self.match.mean,
+            'display': self.display.mean,
+        }
+        return {stage: 1000 / time for stage, time in stages.items() if time > 0}
+
+    def throughput(self):
+        """The frames per second which were displayed."""
+        if len(self.finished) < 2:
+            return np.nan
+        return (len(self.finished) - 1) / (self.finished.last - self.finished.first)
+
+    def report_pipeline(self):
+        stages = ", ".join("{}={:.1f}".format(stage, fps)
+                           for stage, fps in self.stage_throughput().items())
+        print("Stage throughput (fps): {}".format(stages))
+        if len(self.keyframe):
+            print("Keyframes={:.1%} of frames".format(self.keyframe.mean))
+        print("Throughput={:.1f} fps, latency={:.3f} ms (95th percentile {:.3f} ms)".format(
+            self.throughput(), self.latency.mean, self.latency.quantile(0.95)))
+
+    def save_data(self, path=RESULTS):
+        with open(join(path, 'perf.csv'), 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(['detect', 'compute', 'match', 'nkps'])
-            rows = zip(self.detect, self.compute, self.match, self.nkps)
+            writer.writerow(['detect', 'compute', 'match', 'nkps', 'searched', 'decode', 'display',
+                             'latency', 'flow', 'keyframe'])
+            columns = (self.detect, self.compute, self.match, self.nkps, self.searched, self.decode,
+                       self.display, self.latency, self.flow, self.keyframe)
+            rows = zip_longest(*(column.history().tolist() for column in columns), fillvalue='')
             writer.writerows(rows)
 
-        fname = join('results', 'centres.csv')
-        centres = np.array(self.centres).reshape(-1, 2)
-        np.savetxt(fname, centres, delimiter=',')
+        fname = join(path, 'centres.csv')
+        np.savetxt(fname, self.centres.history(), delimiter=',')
+
+        fname = join(path, 'homographies.csv')
+        homographies = self.homographies.history().reshape(-1, 9)
+        np.savetxt(fname, homographies, delimiter=',')
@@ -0,0 +1,145 @@
+import queue
+import threading
+from time import perf_counter
+
+
+_END = object()  # Marks the end of the frames in a queue
+
+
+class Pipeline:
+    """
+    Track the target through frames with the stages on separate threads.
+
+    Decoding, feature extraction and matching each run on their own thread,
+    connected by bounded queues, so that the stages overlap while OpenCV
+    releases the GIL. Iterating over the pipeline, on the display thread,
+    gives each frame and its target corners in order, just as the serial
+    loop would find them.
+
+    When the tracker follows the target with optical flow, features are
+    extracted in the match stage instead, as only it knows which frames are
+    keyframes: a frame is only re-detected and matched once following the
+    points into that same frame has failed. So in flow mode extraction and
+    matching don't overlap, and only decoding and display run alongside
+    them.
+
+    Without optical flow, the extract stage runs up to a few frames ahead of
+    the match stage, so the search window predicted from the last frame
+    matched would be stale. It searches the whole of each frame instead,
+    and the tracker's roi setting has no effect. With optical flow, features
+    are extracted in the match stage, so the search window is up to date
+    and is used.
+
+    The time of each stage, and the latency from decoding a frame to the end
+    of its display, are recorded in the tracker's PerfCounter.
+    """
+    def __init__(self, tracking, read, maxsize=2):
+        """
+        tracking is the Tracking to use, with its target set, and read
+        returns the next frame, or None at the end of the video. Each queue
+        holds at most maxsize frames.
+        """
+        self._tracking = tracking
+        self._read = read
+        self._queues = [queue.Queue(maxsize) for _ in range(3)]
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = [
+            threading.Thread(target=self._decode, args=(self._queues[0],), daemon=True),
+            threading.Thread(target=self._stage, args=(self._queues[0], self._queues[1], self._extract),
+                             daemon=True),
+            threading.Thread(target=self._stage, args=(self._queues[1], self._queues[2], self._match),
+                             daemon=True),
+        ]
+
+    def _put(self, q, item):
+        """Put an item in a queue, unless the pipeline is closed while waiting."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        """Get an item from a queue, or _END if the pipeline is closed while waiting."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _decode(self, out):
+        try:
+            while True:
+                start = perf_counter()
+                frame = self._read()
+                self._tracking.perf.decode.append((perf_counter() - start) * 1000)
+
+                if frame is None or not self._put(out, (start, frame)):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(out, _END)
+
+    def _extract(self, frame):
+        # With optical flow, only the match stage knows which frames are keyframes needing features
+        if self._tracking.flow:
+            return None, None
+        # The search window is predicted from the last frame matched, which lags behind this one
+        return self._tracking.extract(frame, whole=True)
+
+    def _match(self, frame, pts, des):
+        if self._tracking.flow:
+            return self._tracking.follow(frame),
+        return self._tracking.locate(pts, des),
+
+    def _stage(self, source, out, func):
+        try:
+            while True:
+                item = self._get(source)
+                if item is _END:
+                    break
+
+                start, frame, *args = item
+                if not self._put(out, (start, frame, *func(frame, *args))):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(out, _END)
+
+    def __iter__(self):
+        perf = self._tracking.perf
+        for thread in self._threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(self._queues[-1])
+                if item is _END:
+                    break
+
+                start, frame, corners = item
+                shown = perf_counter()
+                yield frame, corners
+
+                end = perf_counter()
+                perf.display.append((end - shown) * 1000)
+                perf.latency.append((end - start) * 1000)
+                perf.finished.append(end)
+        finally:
+            self.close()
+
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Stop the stages, and wait for their threads."""
+        self._stop.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
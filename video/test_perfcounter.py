@@ -0,0 +1,114 @@
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+from .perfcounter import P2Quantile, PerfCounter, RingLog, Series
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.mark.parametrize('p', [0.5, 0.95, 0.99])
+def test_p2_quantile_matches_percentile(rng, p):
+    values = rng.lognormal(0, 0.5, 5000)  # Skewed, like frame times
+    estimate = P2Quantile(p)
+    for value in values:
+        estimate.add(value)
+
+    # Compare the fraction of values below the estimate, as the tails are sparse
+    assert np.mean(values <= estimate.value) == pytest.approx(p, abs=0.01)
+    assert estimate.value == pytest.approx(np.percentile(values, p * 100), rel=0.05)
+
+
+def test_p2_quantile_few_values():
+    estimate = P2Quantile(0.5)
+    assert np.isnan(estimate.value)
+    for value in (3, 1, 2):
+        estimate.add(value)
+    assert estimate.value == 2
+
+
+def test_ring_log_flush(tmp_path, rng):
+    values = rng.normal(size=30)
+    log = RingLog(str(tmp_path / 'log'), capacity=8)
+
+    for value in values[:13]:
+        log.append(value)
+    log.flush()
+    assert len(np.fromfile(log.fname)) == 13
+    np.testing.assert_array_equal(log.history(), values[:13])
+
+    # Filling the buffer only logs the values after those already flushed
+    for value in values[13:]:
+        log.append(value)
+    np.testing.assert_array_equal(np.fromfile(log.fname), values[:24])
+    np.testing.assert_array_equal(log.history(), values)
+
+    log.flush()
+    log.flush()
+    np.testing.assert_array_equal(np.fromfile(log.fname), values)
+    np.testing.assert_array_equal(log.history(), values)
+
+
+def test_series_statistics(tmp_path, rng):
+    values = rng.normal(10, 2, 50)
+    series = Series(str(tmp_path / 'series'), window=5, capacity=16)
+    for i, value in enumerate(values):
+        if i == 20:
+            series.flush()
+        series.append(value)
+
+    np.testing.assert_allclose(series.history(), values)
+    assert series.mean == pytest.approx(values.mean())
+    assert series.rolling_mean == pytest.approx(values[-5:].mean())
+    assert series.rolling_std == pytest.approx(values[-5:].std())
+
+
+def test_perf_counter_close(tmp_path):
+    perf = PerfCounter(window=5, capacity=16, log_dir=str(tmp_path))
+    for i in range(20):
+        perf.detect.append(i)
+        perf.centres.append([i, i])
+    perf.close()
+
+    np.testing.assert_array_equal(np.fromfile(perf.detect.fname), np.arange(20))
+    assert np.fromfile(perf.centres.fname).shape == (40,)
+
+
+def test_perf_counter_collected(tmp_path):
+    with PerfCounter(window=5, capacity=16, log_dir=str(tmp_path)) as perf:
+        perf.detect.append(1)
+    assert len(np.fromfile(perf.detect.fname)) == 1
+
+    perf = PerfCounter(window=5, capacity=16, log_dir=str(tmp_path))
+    perf.detect.append(2)
+    ref = weakref.ref(perf)
+    del perf
+    gc.collect()
+    assert ref() is None  # Not kept alive until exit
+    np.testing.assert_array_equal(np.fromfile(str(tmp_path / 'detect')), [2])
+
+
+def test_series_quantiles_in_order(tmp_path, rng):
+    for _ in range(50):
+        n = rng.integers(10, 200)
+        values = rng.exponential(10, n)
+        series = Series(str(tmp_path / 'series'), window=5, quantiles=(0.5, 0.95, 0.99), capacity=16)
+        for value in values:
+            series.append(value)
+
+        estimates = [series.quantile(p) for p in (0.5, 0.95, 0.99)]
+        assert estimates == sorted(estimates)
+
+
+def test_series_quantiles_exact_in_buffer(tmp_path, rng):
+    values = rng.exponential(10, 40)
+    series = Series(str(tmp_path / 'series'), quantiles=(0.5, 0.95, 0.99), capacity=64)
+    for value in values:
+        series.append(value)
+    for p in (0.5, 0.95, 0.99):
+        assert series.quantile(p) == pytest.approx(np.percentile(values, p * 100))
@@ -1,22 +1,41 @@
 #!/usr/bin/env python3
+"""
+Track a target selected with the mouse through a video.
+
+Run it from the top of the repository, with python -m video.testvideo.
+"""
+
+import os
+import sys
+from time import perf_counter
 
 import cv2
 import numpy as np
 
-from tracking import Tracking
-from videocontroller import VideoController
+from .pipeline import Pipeline
+from .tracking import Tracking
+from .videocontroller import VideoController
 
 
 class UserInterface(object):
-    def __init__(self):
+    def __init__(self, roi=False, flow=False, target_file=None):
         super().__init__()
 
         self._controller = VideoController()
-        self._shown_frame = self._controller.frame
+        self._paused_frame = self._controller.frame
+        self._shown_frame = self._paused_frame
 
         self._initial_point = (0, 0)
         self._selecting = False
-        self._tracking = Tracking()
+        self._tracking = Tracking(roi=roi, flow=flow)
+
+        # A saved target is tracked straight away, and a newly selected one is saved
+        if target_file is not None and not target_file.endswith('.npz'):
+            target_file += '.npz'  # As np.savez() would add it when saving
+        self._target_file = target_file
+        if target_file is not None and os.path.exists(target_file):
+            self._tracking.load_target(target_file)
+            self._controller.paused = False
 
         cv2.namedWindow('output', cv2.WINDOW_AUTOSIZE)
         cv2.setMouseCallback('output', self._mouse_callback)
@@ -30,7 +49,7 @@ class UserInterface(object):
 
             elif event == cv2.EVENT_MOUSEMOVE:
                 if self._selecting:
-                    self._shown_frame = np.copy(self._controller.frame)
+                    self._shown_frame = np.copy(self._paused_frame)
                     self._shown_frame = cv2.cvtColor(self._shown_frame, cv2.COLOR_GRAY2BGR)
                     cv2.rectangle(self._shown_frame, self._initial_point, (x, y), (0,255,0), 1)
 
@@ -38,33 +57,83 @@ class UserInterface(object):
                 self._selecting = False
                 tl = np.min((self._initial_point, (x, y)), axis=0)  # top left
                 br = np.max((self._initial_point, (x, y)), axis=0)  # bottom right
-                roi = np.copy(self._controller.frame[tl[1]:br[1], tl[0]:br[0]])
+                roi = np.copy(self._paused_frame[tl[1]:br[1], tl[0]:br[0]])
                 self._tracking.target = roi
+                if self._target_file is not None:
+                    self._tracking.save_target(self._target_file)
+
+    def _pause(self, frame):
+        self._controller.paused = True
+        self._paused_frame = frame
+        self._shown_frame = np.copy(frame)
+
+    def _show(self, frame, dst):
+        if dst is not None:
+            img = cv2.polylines(frame, [np.int32(dst)], True, 255, 3, cv2.LINE_AA)
+            cv2.imshow('output', img)
+        else:
+            cv2.imshow('output', frame)
+
+    def _wait_while_paused(self):
+        """Show the paused frame until 'p' is pressed again."""
+        while self._controller.paused:
+            cv2.imshow('output', self._shown_frame)
+            if cv2.waitKey(1) == ord('p'):
+                self._controller.paused = False
+
+    def run(self, pipelined=False):
+        if pipelined:
+            self._run_pipelined()
+            return
 
-    def run(self):
+        perf = self._tracking.perf
         while True:
 
             if self._controller.paused:
                 cv2.imshow('output', self._shown_frame)
             else:
+                start = perf_counter()
                 frame = self._controller.frame
+                perf.decode.append((perf_counter() - start) * 1000)
                 if frame is None:
+                    self._tracking.perf.report_pipeline()
                     self._tracking.perf.save_data()
                     break
 
                 dst = self._tracking.find_corners(frame, self._tracking.target)
-                if dst is not None:
-                    img = cv2.polylines(frame, [np.int32(dst)], True, 255, 3, cv2.LINE_AA)
-                    cv2.imshow('output', img)
-                else:
-                    cv2.imshow('output', frame)
+                shown = perf_counter()
+                self._show(frame, dst)
 
             c = cv2.waitKey(1)
+            if not self._controller.paused:
+                end = perf_counter()
+                perf.display.append((end - shown) * 1000)
+                perf.latency.append((end - start) * 1000)
+                perf.finished.append(end)
+
             if c == ord('p'):
                 self._controller.paused = not self._controller.paused
                 if self._controller.paused:
-                    self._shown_frame = np.copy(self._controller.frame)
+                    self._pause(self._controller.frame)
+
+    def _run_pipelined(self):
+        # The target is selected while paused, as in the serial loop
+        self._wait_while_paused()
+
+        for frame, dst in Pipeline(self._tracking, self._controller.read):
+            self._show(frame, dst)
+
+            # While paused, the full queues hold the other stages back
+            if cv2.waitKey(1) == ord('p'):
+                self._pause(frame)
+                self._wait_while_paused()
+
+        self._tracking.perf.report_pipeline()
+        self._tracking.perf.save_data()
 
 if __name__ == '__main__':
-    interface = UserInterface()
-    interface.run()    
+    args = sys.argv[1:]
+    target_file = args[args.index('--target') + 1] if '--target' in args else None
+    interface = UserInterface(roi='--roi' in args, flow='--flow' in args, target_file=target_file)
+    interface.run(pipelined='--pipelined' in args)
+
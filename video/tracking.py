@@ -3,72 +3,290 @@ from time import perf_counter
 import cv2
 import numpy as np
 
-from perfcounter import PerfCounter
+from performance.tests.detectordescriptor import DetectorDescriptor
+from performance.tests.keypoints import from_cv, points, strongest, to_cv
+from performance.tests.matchers import Matcher, TrainedMatcher
+
+from .perfcounter import PerfCounter
+
 
 class Tracking:
-    def __init__(self):
-        self._det = cv2.AgastFeatureDetector_create(threshold=30)
-        self._desc = cv2.ORB_create()
+    """
+    Track a target through frames by matching features.
+
+    The features are detected and described with algo, a DetectorDescriptor,
+    by default Agast and ORB, and matched with matcher, by default FLANN LSH
+    with a ratio test.
+
+    With roi, features are only detected and described in a search window
+    around where the target is predicted to be. The prediction moves the
+    target's corners from the last frame by their motion between the last
+    two frames, and the window is the bounding box of the predicted corners,
+    grown by margin times its size on each side and by border pixels, so
+    that features near its edge are still found and described. The whole
+    frame is searched when the target was lost in the last frame.
+
+    With trained, the matcher's index is built over the target's descriptors
+    once, when the target is set, and each frame's descriptors are queried
+    against it. Otherwise a new index is built over every frame's
+    descriptors. A trained target can be saved, and loaded again by a
+    restarted tracker without selecting it again.
+
+    With flow, features are only matched in keyframes. Between them, the
+    inlier points of the last keyframe are followed with pyramidal
+    Lucas-Kanade optical flow, and the homography is found again from where
+    they moved to. The next frame is a keyframe after keyframe_interval
+    frames, or once fewer than min_points points are followed or fewer than
+    min_inlier_ratio of them fit the homography.
+
+    With target_features, only that many of the target's features with the
+    strongest responses are kept, so that each frame is matched against
+    fewer descriptors.
+    """
+    border = 32  # ORB's default edgeThreshold, rounded up
+    lk_params = dict(winSize=(21, 21), maxLevel=3,
+                     criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+
+    def __init__(self, roi=False, margin=0.5, trained=True, flow=False, keyframe_interval=10,
+                 min_points=20, min_inlier_ratio=0.7, target_features=None, algo=None, matcher=None,
+                 report=True):
+        if algo is None:
+            algo = DetectorDescriptor('Agast', 'ORB', det_params=dict(threshold=30))
+        if algo.desc is None:
+            raise ValueError("No descriptor for {}".format(algo.detector_s))
+        self._det = algo.det
+        self._desc = algo.desc
 
         self.perf = PerfCounter()
+        self.report = report  # Print the recent timings after every match
+
+        self._matcher = matcher or Matcher('flann-lsh', 'ratio', 0.8)
 
-        FLANN_INDEX_LSH = 6
-        index_params = dict(algorithm = FLANN_INDEX_LSH, table_number = 6, key_size = 12, multi_probe_level = 1)
-        search_params = dict(checks = 50)
-        self._matcher = cv2.FlannBasedMatcher(index_params, search_params)
+        self.trained = trained
+        self.target_features = target_features
+        self.roi = roi
+        self.margin = margin
+        self._track = None  # The last corners found, and their last motion
+
+        self.flow = flow
+        self.keyframe_interval = keyframe_interval
+        self.min_points = min_points
+        self.min_inlier_ratio = min_inlier_ratio
+        self._flow = None  # The last frame, the target's points, and where they are in that frame
+        self._since_keyframe = 0
 
     @property
     def target(self):
-        return self._target
+        return self._target[0]
 
     @target.setter
     def target(self, target):
-        self._target = target
-        self._targetkps = self._det.detect(target, None)
-        self._targetkps, self._targetdes = self._desc.compute(target, self._targetkps)
+        kps = self._det.detect(target, None)
+        if self.target_features is not None:
+            kps = to_cv(strongest(from_cv(kps), self.target_features))
+        kps, des = self._desc.compute(target, kps)
+
+        index = self._matcher.train(des) if self.trained and des is not None else None
+        self._set_target(target, points(kps).astype(np.float32), des, index)
+
+    def _set_target(self, target, targetpts, des, index):
+        # Replaced all at once, so that a pipelined match stage never mixes two targets
+        self._target = (target, targetpts, des, index)
+        self._track = None
+        self._flow = None
+
+    def save_target(self, file):
+        """Save the target and its trained index, for load_target()."""
+        target, targetpts, des, index = self._target
+        if index is None:
+            index = self._matcher.train(des)
+        index.save(file, image=target, points=targetpts)
+
+    def load_target(self, file):
+        """Load a target saved by save_target(), with the matcher it was trained with."""
+        index, arrays = TrainedMatcher.load(file)
+        self._matcher = index.matcher
+        self._set_target(arrays['image'], arrays['points'], index.des,
+                         index if self.trained else None)
+
+    def search_window(self, shape):
+        """
+        The (x0, y0, x1, y1) window of a frame to search for the target in,
+        or None to search the whole frame.
+        """
+        track = self._track
+        if not self.roi or track is None:
+            return None
+
+        corners, motion = track
+        predicted = corners + motion
+        if not np.all(np.isfinite(predicted)):
+            return None
+
+        (x0, y0), (x1, y1) = predicted.min(axis=0), predicted.max(axis=0)
+        pad_x = self.margin * (x1 - x0) + self.border
+        pad_y = self.margin * (y1 - y0) + self.border
+
+        rows, cols = shape[:2]
+        x0, y0 = max(int(x0 - pad_x), 0), max(int(y0 - pad_y), 0)
+        x1, y1 = min(int(np.ceil(x1 + pad_x)), cols), min(int(np.ceil(y1 + pad_y)), rows)
+        if x1 - x0 <= 2 * self.border or y1 - y0 <= 2 * self.border:
+            return None  # Predicted off the frame
+        return x0, y0, x1, y1
+
+    def extract(self, image, whole=False):
+        """
+        Detect and describe the features of a frame, in its search window,
+        or in the whole frame with whole.
+
+        Returns the (N, 2) float32 positions of the features in the frame,
+        and their descriptors.
+        """
+        window = None if whole else self.search_window(image.shape)
+        if window is not None:
+            x0, y0, x1, y1 = window
+            region = image[y0:y1, x0:x1]
+        else:
+            region = image
 
-    def find_homography(self, image):
         start = perf_counter()
-        kps = self._det.detect(image, None)
+        kps = self._det.detect(region, None)
         mid = perf_counter()
-        kps, des = self._desc.compute(image, kps)
+        kps, des = self._desc.compute(region, kps)
         end = perf_counter()
 
         self.perf.detect.append((mid - start) * 1000)
         self.perf.compute.append((end - mid) * 1000)
         self.perf.nkps.append(len(kps))
+        self.perf.searched.append(region.size / image.size)
 
-        start = perf_counter()
-        matches = self._matcher.knnMatch(self._targetdes, des, 2)
+        # Only the positions are used, which OpenCV converts without building a keypoint array
+        pts = points(kps).astype(np.float32)
+        if window is not None:
+            pts += (x0, y0)
+        return pts, des
+
+    def match(self, pts, des, target=None):
+        """Find the homography from a target, by default the current one, to a frame's features."""
+        return self._match(pts, des, target)[0]
+
+    def _match(self, pts, des, target=None):
+        """
+        The homography, and the target's points and the frame's points which
+        fit it, or None and no points.
+        """
+        _, targetpts, targetdes, index = target or self._target
+        none = (None, np.empty((0, 2), np.float32), np.empty((0, 2), np.float32))
 
-        good = []
-        for m, n in matches:
-            if m.distance < 0.8 * n.distance:
-                good.append(m)
+        start = perf_counter()
+        if index is not None:
+            good = index.match(des)
+        else:
+            good = self._matcher.match(targetdes, des)
         end = perf_counter()
         self.perf.match.append((end - start) * 1000)
-        self.perf.report_last(20)
+        if self.report:
+            self.perf.report_last()
 
         if len(good) < 4:
-            return  # Not enough good matches
+            return none  # Not enough good matches
 
-        apts = np.float32([self._targetkps[m.queryIdx].pt for m in good])
-        bpts = np.float32([kps[m.trainIdx].pt for m in good])
+        qidx = np.array([m.queryIdx for m in good], int)
+        tidx = np.array([m.trainIdx for m in good], int)
+        if index is not None:
+            qidx, tidx = tidx, qidx  # The frame's descriptors were the queries
+        apts = targetpts[qidx]
+        bpts = pts[tidx]
 
         H, mask = cv2.findHomography(apts, bpts, cv2.RANSAC, 3.0)
+        if H is None:
+            return none
+        inliers = mask.ravel() == 1
+        return H, apts[inliers], bpts[inliers]
+
+    def find_homography(self, image, target=None):
+        """Find the homography from a target, by default the current one, to a frame."""
+        if not self.flow:
+            return self.match(*self.extract(image), target)
+
+        start = perf_counter()
+        H = self._follow(image, target)
+        self.perf.flow.append((perf_counter() - start) * 1000)
+        self.perf.keyframe.append(H is None)
+
+        if H is not None:
+            # No features were detected, described or matched in this frame
+            for times in (self.perf.detect, self.perf.compute, self.perf.match, self.perf.nkps,
+                          self.perf.searched):
+                times.append(0)
+            return H
+
+        H, targetpts, pts = self._match(*self.extract(image), target)
+        self._flow = (image, targetpts, pts) if len(pts) >= self.min_points else None
+        self._since_keyframe = 0
         return H
 
-    def find_corners(self, image, target):
-        H = self.find_homography(image)
+    def _follow(self, image, target=None):
+        """
+        Find the homography by following the last points with optical flow,
+        or None when the frame should be a keyframe.
+        """
+        state = self._flow
+        # The points may be of a target set since this frame's target was taken
+        if (state is None or self._since_keyframe >= self.keyframe_interval or
+                (target is not None and target is not self._target)):
+            return None
+        last, targetpts, pts = state
+
+        nextpts, status, _ = cv2.calcOpticalFlowPyrLK(last, image, pts.reshape(-1, 1, 2), None,
+                                                      **self.lk_params)
+        followed = status.ravel() == 1
+        targetpts, nextpts = targetpts[followed], nextpts.reshape(-1, 2)[followed]
+        if len(nextpts) < self.min_points:
+            return None
+
+        H, mask = cv2.findHomography(targetpts, nextpts, cv2.RANSAC, 3.0)
+        if H is None:
+            return None
+        inliers = mask.ravel() == 1
+        if np.count_nonzero(inliers) < max(self.min_points, self.min_inlier_ratio * len(inliers)):
+            return None
+
+        self._flow = (image, targetpts[inliers], nextpts[inliers])
+        self._since_keyframe += 1
+        return H
 
+    def corners(self, H, shape):
+        """Find where the corners of a target of a given shape are moved by a homography."""
         if H is not None:
-            h, w = target.shape
+            h, w = shape[:2]
             pts = np.float32([[0, 0], [0, h-1], [w-1, h-1], [w-1, 0]]).reshape(-1, 1, 2)
             pts = cv2.perspectiveTransform(pts, H)
 
             centre = np.mean(pts, axis=0).round()
             self.perf.centres.append(centre)
+            self.perf.homographies.append(H)
+
+            corners = pts.reshape(-1, 2)
+            last = self._track
+            motion = corners - last[0] if last is not None else np.zeros_like(corners)
+            self._track = (corners, motion)
 
             return pts
         else:
             self.perf.centres.append(np.array([[np.nan, np.nan]]))
+            self.perf.homographies.append(np.full((3, 3), np.nan))
+            self._track = None  # Lost, so search the whole of the next frame
+
+    def find_corners(self, image, target):
+        return self.corners(self.find_homography(image), target.shape)
+
+    def follow(self, image):
+        """Find the corners of the current target in a frame, by optical flow where possible."""
+        target = self._target
+        return self.corners(self.find_homography(image, target), target[0].shape)
+
+    def locate(self, pts, des):
+        """Find the corners of the current target from a frame's features."""
+        target = self._target
+        return self.corners(self.match(pts, des, target), target[0].shape)
@@ -1,7 +1,9 @@
-FILE_PATTERN = "images/image%05d.png"
+from os.path import abspath, dirname, join
 
 import cv2
 
+FILE_PATTERN = join(dirname(abspath(__file__)), "images", "image%05d.png")
+
 
 class VideoController(object):
     def __init__(self):
@@ -25,10 +27,14 @@ class VideoController(object):
         if self.paused == True:
             return self._saved_frame
         else:
-            ret, img = self._cap.read()
-            if ret == False:
-                return None
-            else:
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                self._saved_frame = img
-                return img
+            return self.read()
+
+    def read(self):
+        """Read the next frame, whether or not the video is paused."""
+        ret, img = self._cap.read()
+        if ret == False:
+            return None
+        else:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            self._saved_frame = img
+            return img